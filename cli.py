@@ -0,0 +1,213 @@
+"""
+Command line tools for working with trackings without the web interface.
+
+Usage:
+    python cli.py daemon
+    python cli.py init-db
+    python cli.py archive
+    python cli.py profile --runs 5 --tracking 42
+    python cli.py import trackings.csv
+    python cli.py import trackings.json --batch-size 1000
+    python cli.py export trackings -o trackings.csv
+    python cli.py export states > states.csv
+
+The daemon runs the scheduler and the capture engine without the web interface; set
+`scheduler.run_in_ui` to false in the settings so that the web interface does not run the
+checks as well. Trackings imported here are scheduled by the daemon on its next sync, or by
+the web interface the next time it starts. On every sync the daemon logs the statistics
+of the capture admission controller, which the web interface shows only while it runs the
+checks itself.
+
+Heavy dependencies are imported inside the commands that need them, so every command only
+pays for what it uses.
+"""
+import argparse
+import logging
+import pathlib
+import signal
+import sys
+import threading
+
+logger = logging.getLogger('daemon')
+
+
+def daemon(args: argparse.Namespace) -> int:
+    from sqlalchemy.exc import SQLAlchemyError
+
+    import config
+    from comparer.profiling import profiler
+    from comparer.scheduler import MyScheduler
+    from comparer.states import admission
+    from db.engine import create_schema
+    from db.utils import get_all_trackings
+    from startup import record_startup
+
+    logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    create_schema()
+    scheduler = MyScheduler()
+    scheduler.add_trackings(get_all_trackings())
+    if config.archive_enabled:
+        scheduler.add_periodic(
+            'comparer.archive:archive_old_states',
+            config.archive_interval_hours * 60 * 60,
+            'archive',
+        )
+    logger.info(record_startup('daemon'))
+    logger.info('Scheduled %d jobs', len(scheduler.get_all_jobs()))
+
+    profiler.poll_requests()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        while not stop.wait(args.sync_interval or config.scheduler_sync_interval):
+            profiler.poll_requests()
+            try:
+                added, removed = scheduler.sync(get_all_trackings())
+            except SQLAlchemyError:
+                logger.exception('Could not sync trackings')
+                continue
+            if added or removed:
+                logger.info('Added %d and removed %d trackings', added, removed)
+            stats = admission.stats()
+            logger.info(
+                'Captures in flight: %d of %d, admitted: %d, deferred: %d, '
+                'browser memory: %.0f MB, expected peak: %.0f MB, available: %.0f MB',
+                stats.in_flight,
+                admission.max_in_flight,
+                stats.admitted,
+                stats.deferrals,
+                stats.capture_rss_mb,
+                stats.estimate_mb,
+                stats.available_mb,
+            )
+    except KeyboardInterrupt:
+        pass
+    logger.info('Waiting for running checks to finish')
+    scheduler.shutdown()
+    return 0
+
+
+def init_db(args: argparse.Namespace) -> int:
+    from db.engine import create_schema
+
+    create_schema()
+    return 0
+
+
+def archive(args: argparse.Namespace) -> int:
+    from comparer.archive import archive_old_states
+
+    stats = archive_old_states()
+    print(
+        f'Ключевых кадров: {stats.keyframes}, разностей: {stats.deltas}, '
+        f'размер: {stats.bytes_before} -> {stats.bytes_after} байт'
+    )
+    return 0
+
+
+def profile(args: argparse.Namespace) -> int:
+    from comparer.profiling import profiler
+
+    profiler.request(0 if args.off else args.runs, args.tracking)
+    print(f'Профили будут сохранены в {profiler.folder}')
+    return 0
+
+
+def import_trackings(args: argparse.Namespace) -> int:
+    from db.bulk import parse_trackings
+    from db.engine import create_schema
+    from db.utils import create_new_trackings
+
+    path = pathlib.Path(args.file)
+    format = args.format or ('json' if path.suffix.lower() == '.json' else 'csv')
+    trackings, errors = parse_trackings(
+        path.read_text(encoding='utf-8-sig'), format
+    )
+    for error in errors:
+        print(error, file=sys.stderr)
+    create_schema()
+    created = create_new_trackings(trackings, batch_size=args.batch_size)
+    print(f'Импортировано отслеживаний: {len(created)}, пропущено записей: {len(errors)}')
+    return 1 if errors else 0
+
+
+def export(args: argparse.Namespace) -> int:
+    from db.bulk import export_states_csv, export_trackings_csv
+
+    lines = export_trackings_csv() if args.what == 'trackings' else export_states_csv()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as file:
+            file.writelines(lines)
+    else:
+        sys.stdout.writelines(lines)
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    daemon_parser = commands.add_parser(
+        'daemon', help='run the scheduled checks without the web interface'
+    )
+    daemon_parser.add_argument(
+        '--sync-interval', type=float,
+        help='seconds between reloads of the trackings, scheduler.sync_interval by default',
+    )
+    daemon_parser.set_defaults(handler=daemon)
+
+    init_db_parser = commands.add_parser(
+        'init-db', help='create the database tables that do not exist yet'
+    )
+    init_db_parser.set_defaults(handler=init_db)
+
+    archive_parser = commands.add_parser(
+        'archive', help='move old screenshots into the per-tracking archives now'
+    )
+    archive_parser.set_defaults(handler=archive)
+
+    profile_parser = commands.add_parser(
+        'profile', help='profile the next checks run by the daemon'
+    )
+    profile_parser.add_argument(
+        '--runs', type=int, default=5, help='number of checks to profile'
+    )
+    profile_parser.add_argument(
+        '--tracking', type=int, help='ID of the tracking, all trackings by default'
+    )
+    profile_parser.add_argument(
+        '--off', action='store_true', help='cancel all pending profiling'
+    )
+    profile_parser.set_defaults(handler=profile)
+
+    import_parser = commands.add_parser(
+        'import', help='import trackings from a CSV or JSON file'
+    )
+    import_parser.add_argument('file', help='path to the CSV or JSON file')
+    import_parser.add_argument(
+        '--format', choices=['csv', 'json'],
+        help='file format, detected from the extension by default',
+    )
+    import_parser.add_argument(
+        '--batch-size', type=int, default=500,
+        help='number of trackings inserted per transaction',
+    )
+    import_parser.set_defaults(handler=import_trackings)
+
+    export_parser = commands.add_parser(
+        'export', help='export trackings or webpage states as CSV'
+    )
+    export_parser.add_argument('what', choices=['trackings', 'states'])
+    export_parser.add_argument(
+        '-o', '--output', help='file to write, standard output by default'
+    )
+    export_parser.set_defaults(handler=export)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,2 @@
-from .scheduler import MyScheduler
+# Submodules are imported by name, e.g. `from comparer.scheduler import MyScheduler`, so that
+# importing one of them does not load the scheduler, the database and the capture engine.
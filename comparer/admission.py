@@ -0,0 +1,171 @@
+import contextlib
+import threading
+from typing import Iterator
+
+import psutil
+from pydantic import BaseModel
+
+
+class CaptureDeferred(Exception):
+    """Raised when a capture cannot start because the host has no memory headroom for it."""
+
+
+class AdmissionStats(BaseModel):
+    """
+    Snapshot of the admission controller, for tuning its limits.
+
+    Attributes:
+        in_flight (int): Number of captures running now.
+        admitted (int): Number of captures started since launch.
+        deferrals (int): Number of captures deferred since launch.
+        capture_rss_mb (float): Resident memory of all running browsers, in MB.
+        estimate_mb (float): Expected peak memory of one capture, in MB.
+        available_mb (float): Memory available on the host, in MB.
+    """
+    in_flight: int
+    admitted: int
+    deferrals: int
+    capture_rss_mb: float
+    estimate_mb: float
+    available_mb: float
+
+
+class CaptureSlot:
+    """
+    Memory accounting of one admitted capture.
+
+    Attributes:
+        pids (list[int]): Root processes of the capture, usually the chromedriver service.
+        rss (int): Resident memory of the capture's process trees at the last sample, in bytes.
+        peak_rss (int): Highest sampled resident memory, in bytes.
+
+    Methods:
+        register(self, pid: int): Adds a process tree to the capture.
+        sample(self) -> int: Measures the resident memory of the capture.
+    """
+    def __init__(self):
+        self.pids: list[int] = []
+        self.rss = 0
+        self.peak_rss = 0
+
+    def register(self, pid: int):
+        """
+        Adds a process and all of its descendants to the capture.
+
+        Args:
+            pid (int): The process ID, e.g. of the chromedriver service that starts Chrome.
+        """
+        self.pids.append(pid)
+
+    def sample(self) -> int:
+        """
+        Measures the resident memory of the capture's process trees.
+
+        Returns:
+            int: The resident memory in bytes.
+        """
+        rss = 0
+        for pid in self.pids:
+            try:
+                root = psutil.Process(pid)
+                processes = [root, *root.children(recursive=True)]
+            except psutil.Error:
+                continue
+            for process in processes:
+                try:
+                    rss += process.memory_info().rss
+                except psutil.Error:
+                    pass
+        self.rss = rss
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+
+class AdmissionController:
+    """
+    Starts headless browser captures only while the host has memory headroom for them.
+
+    A capture is admitted if fewer than `max_in_flight` captures are running and the memory
+    available on the host, minus what the running captures are still expected to grow by, minus
+    the expected peak of the new capture, stays above `min_free_mb`. The expected peak starts at
+    `estimate_mb` and follows the peaks measured on finished captures. Captures that are not
+    admitted raise CaptureDeferred so that the caller can requeue them.
+
+    Attributes:
+        min_free_mb (float): Memory that must stay available on the host, in MB.
+        max_in_flight (int): Maximum number of simultaneous captures.
+        estimate_mb (float): Expected peak memory of one capture, in MB.
+
+    Methods:
+        admit(self) -> Iterator[CaptureSlot]: Context manager holding a capture slot.
+        stats(self) -> AdmissionStats: Returns the current counters.
+    """
+    # weight of the latest measured peak in the expected peak
+    ESTIMATE_WEIGHT = 0.3
+
+    def __init__(self, min_free_mb: float, max_in_flight: int, estimate_mb: float):
+        self.min_free_mb = min_free_mb
+        self.max_in_flight = max_in_flight
+        self.estimate_mb = estimate_mb
+        self._lock = threading.Lock()
+        self._slots: set[CaptureSlot] = set()
+        self._admitted = 0
+        self._deferrals = 0
+
+    @contextlib.contextmanager
+    def admit(self) -> Iterator[CaptureSlot]:
+        """
+        Holds a capture slot until the end of the `with` block.
+
+        Yields:
+            CaptureSlot: The slot to register the capture's processes with.
+
+        Raises:
+            CaptureDeferred: If the capture would leave the host without memory headroom.
+        """
+        estimate = self.estimate_mb * 2**20
+        with self._lock:
+            pending_growth = sum(
+                max(estimate - slot.sample(), 0) for slot in self._slots
+            )
+            available = psutil.virtual_memory().available
+            if (
+                len(self._slots) >= self.max_in_flight
+                or available - pending_growth - estimate < self.min_free_mb * 2**20
+            ):
+                self._deferrals += 1
+                raise CaptureDeferred(
+                    f'{len(self._slots)} captures running, '
+                    f'{available / 2**20:.0f} MB available'
+                )
+            slot = CaptureSlot()
+            self._slots.add(slot)
+            self._admitted += 1
+        try:
+            yield slot
+        finally:
+            slot.sample()
+            with self._lock:
+                self._slots.discard(slot)
+                if slot.peak_rss:
+                    self.estimate_mb += self.ESTIMATE_WEIGHT * (
+                        slot.peak_rss / 2**20 - self.estimate_mb
+                    )
+
+    def stats(self) -> AdmissionStats:
+        """
+        Returns the current counters of the controller.
+
+        Returns:
+            AdmissionStats: Captures in flight, totals, memory of the running browsers and the
+                            host's available memory.
+        """
+        with self._lock:
+            return AdmissionStats(
+                in_flight=len(self._slots),
+                admitted=self._admitted,
+                deferrals=self._deferrals,
+                capture_rss_mb=sum(slot.rss for slot in self._slots) / 2**20,
+                estimate_mb=self.estimate_mb,
+                available_mb=psutil.virtual_memory().available / 2**20,
+            )
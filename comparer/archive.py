@@ -0,0 +1,345 @@
+"""
+Archive tier for old screenshots.
+
+Consecutive screenshots of a webpage are mostly identical, so screenshots older than
+`archive.after_days` are moved from their PNG files into zip archives in their states folder.
+A screenshot is stored there either as a keyframe, the original PNG, or as a delta: the
+tiles in which it differs from an earlier keyframe of the same size. Deltas always refer to a
+keyframe directly, so rebuilding any screenshot takes one keyframe, kept decoded in an LRU
+cache bounded by `archive.keyframe_cache_mb`, and a few pasted tiles.
+
+Every archiving run writes a new archive of its own, named `archive-<time>-<random>.zip`, and
+archives are never changed afterwards. The archive is written under a temporary name and
+renamed once it is complete, and the PNG files are removed only after that, so a crash
+during a run loses nothing and readers in other processes never see a half-written archive.
+Deltas only refer to keyframes of the same archive.
+
+The last state of every viewport is never archived, because new screenshots are compared
+with it and the UI links to its file. The database keeps pointing at the original paths;
+`load_screenshot` finds the screenshot in the file or in one of the archives.
+
+Archive layout:
+    keyframes/<name>.png          the original PNG of a keyframe
+    frames/<name>.json            {"keyframe": ..., "tile": ..., "tiles": [[x, y], ...]}
+    tiles/<name>/<x>-<y>.png      a tile of a delta
+"""
+import collections
+import glob
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+
+from PIL import Image, ImageChops
+from pydantic import BaseModel
+
+import config
+
+# matches the archives of every run, and `archive.zip` written by earlier versions
+ARCHIVE_PATTERN = 'archive*.zip'
+
+logger = logging.getLogger(__name__)
+
+_locks: dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+class ArchiveStats(BaseModel):
+    """
+    Result of one archiving run.
+
+    Attributes:
+        keyframes (int): Number of screenshots stored as keyframes.
+        deltas (int): Number of screenshots stored as tile deltas.
+        bytes_before (int): Total size of the archived PNG files.
+        bytes_after (int): Total size of the new archives.
+    """
+    keyframes: int = 0
+    deltas: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+
+def _folder_lock(folder: str) -> threading.Lock:
+    # keeps two runs in this process from archiving the same folder at once
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(folder), threading.Lock())
+
+
+def list_archives(folder: str) -> list[str]:
+    """
+    Lists the complete archives of a states folder.
+
+    Args:
+        folder (str): The states folder.
+
+    Returns:
+        list[str]: The file paths of the archives, newest first.
+    """
+    return sorted(
+        glob.glob(os.path.join(glob.escape(folder), ARCHIVE_PATTERN)),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+
+
+def archive_old_states() -> ArchiveStats:
+    """
+    Archives the screenshots older than `archive.after_days` in every states folder.
+
+    Returns:
+        ArchiveStats: What was archived.
+    """
+    from db.utils import get_last_states
+
+    keep = {
+        os.path.abspath(state.image_filename)
+        for states in get_last_states().values()
+        for state in states
+    }
+    older_than = time.time() - config.archive_after_days * 24 * 60 * 60
+    total = ArchiveStats()
+    with os.scandir(config.screenshots_folder) as entries:
+        folders = [
+            entry.path
+            for entry in entries
+            if entry.is_dir() and not entry.name.startswith('.')
+        ]
+    for folder in folders:
+        stats = archive_folder(folder, keep, older_than)
+        for field in ArchiveStats.model_fields:
+            setattr(total, field, getattr(total, field) + getattr(stats, field))
+    logger.info(
+        'Archived %d keyframes and %d deltas, %d bytes down to %d',
+        total.keyframes,
+        total.deltas,
+        total.bytes_before,
+        total.bytes_after,
+    )
+    return total
+
+
+def archive_folder(folder: str, keep: set[str], older_than: float) -> ArchiveStats:
+    """
+    Moves the old screenshots of one states folder into a new archive.
+
+    Screenshots are taken in the order they were saved. Each becomes a delta of the latest
+    keyframe of the same size and mode, unless there is none, it already has
+    `archive.keyframe_interval` deltas or more than `archive.max_delta_ratio` of the tiles
+    differ, in which case the screenshot becomes a keyframe itself.
+
+    Args:
+        folder (str): The states folder.
+        keep (set[str]): Absolute paths of screenshots that must stay files.
+        older_than (float): Only screenshots modified before this timestamp are archived.
+
+    Returns:
+        ArchiveStats: What was archived.
+    """
+    stats = ArchiveStats()
+    with _folder_lock(folder):
+        with os.scandir(folder) as entries:
+            files = sorted(
+                (
+                    entry
+                    for entry in entries
+                    if entry.is_file()
+                    and entry.name.endswith('.png')
+                    and entry.stat().st_mtime < older_than
+                    and os.path.abspath(entry.path) not in keep
+                ),
+                key=lambda entry: entry.stat().st_mtime,
+            )
+        if not files:
+            return stats
+        archived = set()
+        for path in list_archives(folder):
+            with zipfile.ZipFile(path) as archive:
+                archived.update(archive.namelist())
+        # screenshots archived by a run that was stopped before removing them
+        for entry in files:
+            if f'frames/{entry.name}.json' in archived:
+                os.remove(entry.path)
+        files = [entry for entry in files if os.path.exists(entry.path)]
+        if not files:
+            return stats
+        archive_path = os.path.join(
+            folder, f'archive-{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.zip'
+        )
+        tmp_path = archive_path + '.tmp'
+        try:
+            _write_archive(tmp_path, files, stats)
+            os.replace(tmp_path, archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # the originals are removed only once the archive is complete on disk
+        for entry in files:
+            os.remove(entry.path)
+    stats.bytes_after = os.path.getsize(archive_path)
+    return stats
+
+
+def _write_archive(path: str, files: list[os.DirEntry], stats: ArchiveStats):
+    # the latest keyframe of every image size and mode, with its number of deltas
+    keyframes: dict[tuple, list] = {}
+    tile = config.archive_tile_size
+    with zipfile.ZipFile(path, 'w') as archive:
+        for entry in files:
+            with Image.open(entry.path) as image:
+                image.load()
+                shape = (image.size, image.mode)
+                current = keyframes.get(shape)
+                tiles = None
+                if current and current[2] < config.archive_keyframe_interval:
+                    tiles = changed_tiles(current[1], image, tile)
+                    total_tiles = -(-image.width // tile) * -(-image.height // tile)
+                    if len(tiles) > config.archive_max_delta_ratio * total_tiles:
+                        tiles = None
+                if tiles is None:
+                    archive.write(
+                        entry.path, f'keyframes/{entry.name}', zipfile.ZIP_STORED
+                    )
+                    keyframes[shape] = [entry.name, image.copy(), 0]
+                    frame = {'keyframe': entry.name, 'tile': tile, 'tiles': []}
+                    stats.keyframes += 1
+                else:
+                    for x, y in tiles:
+                        buffer = io.BytesIO()
+                        image.crop((x, y, x + tile, y + tile)).save(buffer, 'PNG')
+                        archive.writestr(
+                            f'tiles/{entry.name}/{x}-{y}.png',
+                            buffer.getvalue(),
+                            zipfile.ZIP_STORED,
+                        )
+                    current[2] += 1
+                    frame = {'keyframe': current[0], 'tile': tile, 'tiles': tiles}
+                    stats.deltas += 1
+            archive.writestr(
+                f'frames/{entry.name}.json', json.dumps(frame), zipfile.ZIP_DEFLATED
+            )
+            stats.bytes_before += entry.stat().st_size
+    with open(path, 'rb') as file:
+        os.fsync(file.fileno())
+
+
+def changed_tiles(
+    reference: Image.Image, image: Image.Image, tile: int
+) -> list[list[int]]:
+    """
+    Finds the tiles in which two images of the same size and mode differ.
+
+    Args:
+        reference (Image.Image): The keyframe.
+        image (Image.Image): The screenshot to compare with it.
+        tile (int): The size of the square tiles in pixels.
+
+    Returns:
+        list[list[int]]: The top left corners `[x, y]` of the differing tiles.
+    """
+    bbox = ImageChops.difference(reference, image).getbbox()
+    if not bbox:
+        return []
+    left, top, right, bottom = bbox
+    tiles = []
+    for y in range(top - top % tile, bottom, tile):
+        for x in range(left - left % tile, right, tile):
+            box = (x, y, x + tile, y + tile)
+            if ImageChops.difference(reference.crop(box), image.crop(box)).getbbox():
+                tiles.append([x, y])
+    return tiles
+
+
+def load_screenshot(path: str) -> Image.Image:
+    """
+    Opens a screenshot, rebuilding it from the archives of its folder if it was archived.
+
+    Args:
+        path (str): The file path of the screenshot as stored in the database.
+
+    Returns:
+        Image.Image: The screenshot.
+
+    Raises:
+        FileNotFoundError: If the screenshot is neither a file nor in an archive.
+    """
+    if os.path.exists(path):
+        return Image.open(path)
+    name = os.path.basename(path)
+    for archive_path in list_archives(os.path.dirname(path)):
+        with zipfile.ZipFile(archive_path) as archive:
+            try:
+                frame = json.loads(archive.read(f'frames/{name}.json'))
+            except KeyError:
+                continue
+            image = keyframes.get(archive_path, frame['keyframe']).copy()
+            for x, y in frame['tiles']:
+                with Image.open(
+                    io.BytesIO(archive.read(f'tiles/{name}/{x}-{y}.png'))
+                ) as piece:
+                    image.paste(piece, (x, y))
+        return image
+    raise FileNotFoundError(path)
+
+
+class KeyframeCache:
+    """
+    Keeps recently used keyframes decoded, up to a total size of their pixel data.
+
+    A keyframe of a tall page in a high-density viewport takes hundreds of megabytes once
+    decoded, so the cache is bounded by bytes rather than by the number of keyframes.
+    Keyframes larger than the whole cache are decoded for every request instead. Archives
+    are never changed once written, so a cached keyframe never goes stale.
+
+    Attributes:
+        max_bytes (int): Total size of the decoded keyframes kept, in bytes.
+
+    Methods:
+        get(self, archive_path, name) -> Image.Image: Returns a decoded keyframe.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._images: collections.OrderedDict[tuple[str, str], Image.Image] = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+
+    def get(self, archive_path: str, name: str) -> Image.Image:
+        """
+        Returns a keyframe of an archive, decoding it if it is not cached.
+
+        Args:
+            archive_path (str): The file path of the archive.
+            name (str): The name of the keyframe's screenshot.
+
+        Returns:
+            Image.Image: The decoded keyframe, shared with other callers; copy it before
+                         changing it.
+        """
+        key = (archive_path, name)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        with zipfile.ZipFile(archive_path) as archive:
+            image = Image.open(io.BytesIO(archive.read(f'keyframes/{name}')))
+            image.load()
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_bytes:
+            return image
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= evicted.width * evicted.height * len(evicted.getbands())
+            return image
+
+
+keyframes = KeyframeCache(config.archive_keyframe_cache_mb * 2**20)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """
+    A per-host circuit breaker for webpage captures.
+
+    After `failure_threshold` consecutive failed captures of a host the breaker opens and the
+    host's trackings are skipped for `cooldown` seconds. Once the cool-down is over a single
+    check is let through as a probe: if it succeeds the breaker closes, if it fails the host
+    is backed off for another cool-down period.
+
+    Attributes:
+        failure_threshold (int): Number of consecutive failures that opens the breaker.
+        cooldown (float): Number of seconds an open breaker keeps a host backed off.
+
+    Methods:
+        allow(self, host: str) -> bool: Tells whether a capture of the host may start.
+        record_success(self, host: str): Closes the breaker of the host.
+        record_failure(self, host: str): Counts a failure and opens the breaker if needed.
+    """
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures: dict[str, int] = {}
+        self._open_until: dict[str, float] = {}
+
+    def allow(self, host: str) -> bool:
+        """
+        Tells whether a capture of the host may start.
+
+        Args:
+            host (str): The hostname of the tracked webpage.
+
+        Returns:
+            bool: False while the host is backed off, True otherwise.
+        """
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return True
+            now = time.monotonic()
+            if now < open_until:
+                return False
+            # let exactly one probe through, the others wait for its outcome
+            self._open_until[host] = now + self.cooldown
+            return True
+
+    def record_success(self, host: str):
+        """
+        Closes the breaker of the host and resets its failure count.
+
+        Args:
+            host (str): The hostname of the tracked webpage.
+        """
+        with self._lock:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+
+    def record_failure(self, host: str):
+        """
+        Counts a failed capture of the host and opens its breaker once the threshold is reached.
+
+        Args:
+            host (str): The hostname of the tracked webpage.
+        """
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._open_until[host] = time.monotonic() + self.cooldown
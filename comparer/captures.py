@@ -0,0 +1,220 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit
+
+from pydantic import BaseModel
+
+from db.schemas import TrackingSchema
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class Capture(BaseModel):
+    """
+    A screenshot of a webpage taken for a tracking.
+
+    Attributes:
+        path (str): The file path of the screenshot in the tracking's states folder.
+        fingerprint (str): SHA-256 of the screenshot file, equal for identical captures.
+    """
+    path: str
+    fingerprint: str
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL so that addresses of the same webpage compare equal.
+
+    The scheme and hostname are lowercased, default ports and fragments are dropped and an
+    empty path becomes `/`.
+
+    Args:
+        url (str): The URL to normalize.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f':{parts.port}'
+    if parts.username:
+        credentials = parts.username
+        if parts.password:
+            credentials += f':{parts.password}'
+        netloc = f'{credentials}@{netloc}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def capture_key(tr: TrackingSchema) -> tuple:
+    """
+    Builds the key under which captures of a tracking are shared with other trackings.
+
+    Two trackings share captures only if they render the same webpage with the same capture
+    settings, so every setting that changes the resulting screenshot belongs in the key.
+
+    Args:
+        tr (TrackingSchema): The tracking information.
+
+    Returns:
+        tuple: The normalized URL followed by the capture settings.
+    """
+    return (
+        normalize_url(tr.url),
+        tr.capture_profile,
+        tr.max_height,
+        tuple(tr.viewports),
+    )
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Computes the fingerprint of a screenshot file.
+
+    Args:
+        path (str): The file path of the screenshot.
+
+    Returns:
+        str: Hex digest of the SHA-256 of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Makes `dst` a hard link to `src`, falling back to a copy across file systems.
+
+    Args:
+        src (str): The existing file.
+        dst (str): The path to create.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class CaptureCache:
+    """
+    Shares recent screenshots of the same webpage between trackings.
+
+    Every capture is kept in the cache folder under its capture key for `freshness` seconds.
+    A tracking that is due while a fresh capture of its key made for another tracking exists
+    gets a copy of that capture and its fingerprint instead of rendering the webpage again. A
+    tracking never gets its own capture back, even if its interval is shorter than
+    `freshness`. Captures of one key never run
+    concurrently, so trackings that fall due together render the webpage once, and at most
+    `per_host_limit` captures of one host run at a time.
+
+    Attributes:
+        folder (str): Folder keeping the cached screenshots.
+        freshness (float): Number of seconds a capture may be reused for.
+        per_host_limit (int): Maximum number of simultaneous captures of one host.
+
+    Methods:
+        get(self, tr, capture, new_path) -> dict[str | None, Capture]: Returns a fresh capture
+            of every viewport of the tracking.
+    """
+    def __init__(self, folder: str, freshness: float, per_host_limit: int):
+        self.folder = folder
+        self.freshness = freshness
+        self.per_host_limit = per_host_limit
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple, threading.Lock] = {}
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        # capture key -> (cached screenshots by viewport, capture time, owner tracking ID)
+        self._entries: dict[
+            tuple, tuple[dict[str | None, tuple[str, str]], float, int]
+        ] = {}
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._host_slots.setdefault(
+                host, threading.BoundedSemaphore(self.per_host_limit)
+            )
+
+    def get(
+        self,
+        tr: TrackingSchema,
+        capture: Callable[[TrackingSchema], dict[str | None, str]],
+        new_path: Callable[[TrackingSchema, str | None], str],
+    ) -> dict[str | None, Capture]:
+        """
+        Returns a capture of the tracking's webpage, rendering it only if no fresh one exists.
+
+        Args:
+            tr (TrackingSchema): The tracking the capture is made for.
+            capture (Callable[[TrackingSchema], dict[str | None, str]]): Renders the webpage and
+                returns the file path of the screenshot of every viewport.
+            new_path (Callable[[TrackingSchema, str | None], str]): Returns a new file path in
+                the tracking's states folder for a reused screenshot of a viewport.
+
+        Returns:
+            dict[str | None, Capture]: The screenshots in the tracking's states folder by
+                                       viewport name.
+        """
+        key = capture_key(tr)
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if (
+                entry
+                and entry[2] != tr.id
+                and time.monotonic() - entry[1] < self.freshness
+            ):
+                try:
+                    return self._reuse(tr, entry[0], new_path)
+                except OSError:
+                    self._entries.pop(key, None)
+            with self._host_slot(str(urlsplit(key[0]).hostname)):
+                paths = capture(tr)
+            shots = {
+                viewport: Capture(path=path, fingerprint=file_fingerprint(path))
+                for viewport, path in paths.items()
+            }
+            self._store(key, shots, tr.id)
+            return shots
+
+    def _reuse(
+        self,
+        tr: TrackingSchema,
+        cached: dict[str | None, tuple[str, str]],
+        new_path: Callable[[TrackingSchema, str | None], str],
+    ) -> dict[str | None, Capture]:
+        shots = {}
+        for viewport, (cached_path, fingerprint) in cached.items():
+            path = new_path(tr, viewport)
+            link_or_copy(cached_path, path)
+            shots[viewport] = Capture(path=path, fingerprint=fingerprint)
+        return shots
+
+    def _store(self, key: tuple, shots: dict[str | None, Capture], owner_id: int):
+        if self.freshness <= 0:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        cached = {}
+        for viewport, shot in shots.items():
+            cached_path = os.path.join(
+                self.folder,
+                hashlib.sha256(repr((key, viewport)).encode()).hexdigest() + '.png',
+            )
+            tmp_path = f'{cached_path}.{threading.get_ident()}.tmp'
+            try:
+                link_or_copy(shot.path, tmp_path)
+                os.replace(tmp_path, cached_path)
+            except OSError:
+                return
+            cached[viewport] = (cached_path, shot.fingerprint)
+        self._entries[key] = (cached, time.monotonic(), owner_id)
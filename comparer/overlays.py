@@ -0,0 +1,197 @@
+"""
+Changed regions of a screenshot and the overlay artifacts built from them.
+
+The comparison of a new screenshot with the previous one yields the regions that changed.
+They are drawn once, when the change is detected, into two small JPEG files stored with the
+state: a downscaled copy of the screenshot with the regions highlighted, and a close-up of
+the largest region at full resolution. Notifications and the dashboard show these files
+instead of the full screenshot.
+"""
+from PIL import Image, ImageDraw
+from pydantic import BaseModel
+
+import config
+
+from .archive import changed_tiles
+
+Box = tuple[int, int, int, int]
+
+
+class Overlay(BaseModel):
+    """
+    The overlay artifacts of a detected change.
+
+    Attributes:
+        overlay_filename (str): The downscaled screenshot with the changed regions highlighted.
+        closeup_filename (str): The full-resolution crop of the largest changed region.
+    """
+    overlay_filename: str
+    closeup_filename: str
+
+
+def diff_screenshots(prev_path: str, curr_path: str) -> Overlay | None:
+    """
+    Compares a new screenshot with the previous one and, if they differ, writes its overlay.
+
+    Both screenshots are decoded once, for the comparison and the overlay together.
+
+    Args:
+        prev_path (str): The file path of the previous screenshot.
+        curr_path (str): The file path of the new screenshot.
+
+    Returns:
+        Overlay | None: The overlay artifacts, or None if the screenshots are identical.
+    """
+    with Image.open(prev_path) as prev, Image.open(curr_path) as curr:
+        regions = find_changed_regions(prev, curr)
+        if not regions:
+            return None
+        return write_overlay(curr, curr_path, regions)
+
+
+def find_changed_regions(prev: Image.Image, curr: Image.Image) -> list[Box]:
+    """
+    Compares two screenshots and finds the regions in which they differ.
+
+    The screenshots are compared in square tiles of `overlays.tile_size` pixels, and
+    touching changed tiles are merged into one region. If the page grew or shrank, only the
+    area both screenshots cover is compared: rows and columns the new screenshot gained are
+    a changed region of their own, and the edge where the previous screenshot had more is
+    marked with one tile.
+
+    Args:
+        prev (Image.Image): The previous screenshot.
+        curr (Image.Image): The new screenshot.
+
+    Returns:
+        list[Box]: The `(left, top, right, bottom)` boxes of the changed regions, empty if the
+                   screenshots are identical.
+    """
+    tile = config.overlays_tile_size
+    if prev.mode != curr.mode:
+        prev = prev.convert(curr.mode)
+    width, height = min(prev.width, curr.width), min(prev.height, curr.height)
+    if prev.size != curr.size:
+        common = (0, 0, width, height)
+        tiles = changed_tiles(prev.crop(common), curr.crop(common), tile)
+    else:
+        tiles = changed_tiles(prev, curr, tile)
+    regions = [
+        (left, top, min(right, width), min(bottom, height))
+        for left, top, right, bottom in _merge_tiles(tiles, tile)
+    ]
+    if curr.width > width:
+        regions.append((width, 0, curr.width, height))
+    elif prev.width > width:
+        regions.append((max(0, width - tile), 0, width, height))
+    if curr.height > height:
+        regions.append((0, height, curr.width, curr.height))
+    elif prev.height > height:
+        regions.append((0, max(0, height - tile), curr.width, height))
+    return regions
+
+
+def _merge_tiles(tiles: list[list[int]], tile: int) -> list[Box]:
+    # flood fill over tiles that share an edge or a corner
+    remaining = {(x, y) for x, y in tiles}
+    regions = []
+    while remaining:
+        stack = [remaining.pop()]
+        left, top = stack[0]
+        right, bottom = left + tile, top + tile
+        while stack:
+            x, y = stack.pop()
+            left, top = min(left, x), min(top, y)
+            right, bottom = max(right, x + tile), max(bottom, y + tile)
+            for dx in (-tile, 0, tile):
+                for dy in (-tile, 0, tile):
+                    neighbour = (x + dx, y + dy)
+                    if neighbour in remaining:
+                        remaining.remove(neighbour)
+                        stack.append(neighbour)
+        regions.append((left, top, right, bottom))
+    return regions
+
+
+def write_overlay(
+    screenshot: Image.Image, screenshot_path: str, regions: list[Box]
+) -> Overlay:
+    """
+    Writes the overlay and the close-up of a changed screenshot next to it.
+
+    The overlay is scaled down to fit `overlays.max_width` by `overlays.max_height`. The
+    close-up is the largest region with a margin of `overlays.closeup_margin` pixels, scaled
+    down to fit `overlays.closeup_max_size` if it is larger. Before scaling, both are cut to
+    a side ratio of at most `overlays.max_aspect_ratio`, since Telegram rejects photos with a
+    side ratio above 20: on a very tall page the overlay shows the part starting just above
+    the largest region, and a very long region is cut to its start.
+
+    Args:
+        screenshot (Image.Image): The new screenshot.
+        screenshot_path (str): The file path of the new screenshot.
+        regions (list[Box]): The changed regions, as found by `find_changed_regions`.
+
+    Returns:
+        Overlay: The file paths of the overlay and the close-up.
+    """
+    stem = screenshot_path.removesuffix('.png')
+    overlay_path = f'{stem} overlay.jpg'
+    closeup_path = f'{stem} closeup.jpg'
+    image = screenshot.convert('RGB')
+    largest = max(regions, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]))
+    margin = config.overlays_closeup_margin
+    focus = (
+        max(0, largest[0] - margin),
+        max(0, largest[1] - margin),
+        min(image.width, largest[2] + margin),
+        min(image.height, largest[3] + margin),
+    )
+
+    window = _fit_aspect((0, 0, *image.size), focus)
+    shown = image.crop(window) if window != (0, 0, *image.size) else image
+    scale = min(
+        1,
+        config.overlays_max_width / shown.width,
+        config.overlays_max_height / shown.height,
+    )
+    overlay = shown.resize(
+        (max(1, int(shown.width * scale)), max(1, int(shown.height * scale)))
+    )
+    highlight = Image.new('RGBA', overlay.size)
+    draw = ImageDraw.Draw(highlight)
+    for left, top, right, bottom in regions:
+        draw.rectangle(
+            (
+                (left - window[0]) * scale,
+                (top - window[1]) * scale,
+                (right - window[0]) * scale,
+                (bottom - window[1]) * scale,
+            ),
+            fill=(255, 0, 0, 60),
+            outline=(255, 0, 0, 255),
+            width=2,
+        )
+    overlay = Image.alpha_composite(overlay.convert('RGBA'), highlight).convert('RGB')
+    overlay.save(overlay_path, 'JPEG', quality=config.overlays_quality)
+
+    closeup = image.crop(_fit_aspect(focus, focus))
+    closeup.thumbnail((config.overlays_closeup_max_size,) * 2)
+    closeup.save(closeup_path, 'JPEG', quality=config.overlays_quality)
+    return Overlay(overlay_filename=overlay_path, closeup_filename=closeup_path)
+
+
+def _fit_aspect(box: Box, focus: Box) -> Box:
+    # cuts the long side of the box down to `overlays.max_aspect_ratio` times the short one,
+    # starting where the focus box starts, as far as the box allows
+    ratio = config.overlays_max_aspect_ratio
+    left, top, right, bottom = box
+    width, height = right - left, bottom - top
+    if height > width * ratio:
+        height = max(1, int(width * ratio))
+        top = min(max(top, focus[1]), bottom - height)
+        bottom = top + height
+    elif width > height * ratio:
+        width = max(1, int(height * ratio))
+        left = min(max(left, focus[0]), right - width)
+        right = left + width
+    return left, top, right, bottom
@@ -0,0 +1,240 @@
+import contextlib
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Iterator
+
+from pydantic import BaseModel
+
+import config
+
+if TYPE_CHECKING:
+    # Selenium is imported by the capture code only, see comparer.states.screenshot
+    from selenium import webdriver
+
+# file extensions that stand for a resource type
+RESOURCE_TYPE_EXTENSIONS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'ogg', 'ogv', 'mp3', 'm3u8', 'mov'],
+    'stylesheet': ['css'],
+    'script': ['js', 'mjs'],
+}
+# URL patterns of a resource type, anchored to the end of the path so that hosts and paths
+# merely containing the extension, like https://www.movistar.es/, are not matched
+RESOURCE_TYPE_PATTERNS = {
+    resource_type: [
+        pattern
+        for extension in extensions
+        for pattern in (f'*.{extension}', f'*.{extension}?*')
+    ]
+    for resource_type, extensions in RESOURCE_TYPE_EXTENSIONS.items()
+}
+
+# stops CSS animations, transitions, the caret blink and media playback on every page
+FREEZE_SCRIPT = r"""
+HTMLMediaElement.prototype.play = function () { return Promise.resolve(); };
+document.addEventListener('DOMContentLoaded', () => {
+    const style = document.createElement('style');
+    style.textContent = '*, *::before, *::after { animation: none !important; '
+        + 'transition: none !important; caret-color: transparent !important; '
+        + 'scroll-behavior: auto !important; }';
+    document.head.appendChild(style);
+    document.querySelectorAll('video, audio').forEach((media) => {
+        media.autoplay = false;
+        media.pause();
+    });
+});
+"""
+
+
+class CaptureProfile(BaseModel):
+    """
+    Browser settings a tracking's webpage is captured with.
+
+    Profiles are defined by name in the `capture_profiles` section of the settings and chosen
+    per tracking.
+
+    Attributes:
+        block_url_patterns (list[str]): URL patterns, with `*` wildcards, of requests the browser
+                                        must not make, e.g. analytics and ads.
+        block_resource_types (list[str]): Resource types whose requests are blocked, out of the
+                                          keys of RESOURCE_TYPE_EXTENSIONS.
+        disk_cache (bool): Whether the browser keeps static assets in a persistent disk cache
+                           shared between checks.
+        disable_animations (bool): Whether animations, transitions and media autoplay are
+                                   turned off so that screenshots vary less between checks.
+    """
+    block_url_patterns: list[str] = []
+    block_resource_types: list[str] = []
+    disk_cache: bool = False
+    disable_animations: bool = False
+
+    def blocked_urls(self, url: str | None = None) -> list[str]:
+        """
+        Returns every URL pattern blocked by the profile.
+
+        Args:
+            url (str | None): The URL of the tracked webpage. Patterns matching it are left
+                              out, so the webpage itself is never blocked.
+
+        Returns:
+            list[str]: The explicit URL patterns followed by the resource type patterns.
+        """
+        patterns = list(self.block_url_patterns)
+        for resource_type in self.block_resource_types:
+            patterns.extend(RESOURCE_TYPE_PATTERNS.get(resource_type, []))
+        if url:
+            patterns = [
+                pattern for pattern in patterns if not _pattern_matches(pattern, url)
+            ]
+        return patterns
+
+
+def _pattern_matches(pattern: str, url: str) -> bool:
+    # Chrome's blocked URL patterns only know the `*` wildcard
+    regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+    return re.fullmatch(regex, url) is not None
+
+
+def get_capture_profile(name: str) -> CaptureProfile:
+    """
+    Looks up a capture profile by name.
+
+    Args:
+        name (str): The name of the profile in the settings.
+
+    Returns:
+        CaptureProfile: The profile, or the `default` profile if there is none with that name.
+    """
+    profiles = config.capture_profiles
+    return CaptureProfile(**profiles.get(name, profiles.get('default', {})))
+
+
+class Viewport(BaseModel):
+    """
+    A device layout a tracking's webpage is captured in.
+
+    Viewports are defined by name in the `capture_viewports` section of the settings and
+    listed per tracking. All viewports of a tracking are captured from one page load by
+    emulating each device in turn, so only layouts that the page switches with CSS or scripts
+    are covered, not ones the server picks by user agent.
+
+    Attributes:
+        width (int): Width of the viewport in CSS pixels.
+        height (int): Height of the viewport in CSS pixels.
+        device_scale_factor (float): Number of screenshot pixels per CSS pixel.
+        mobile (bool): Whether the device is emulated as a mobile one, with a meta viewport
+                       and overlay scrollbars.
+    """
+    width: int
+    height: int
+    device_scale_factor: float = 1
+    mobile: bool = False
+
+
+def get_viewport(name: str) -> Viewport:
+    """
+    Looks up a viewport by name.
+
+    Args:
+        name (str): The name of the viewport in the settings.
+
+    Returns:
+        Viewport: The viewport.
+
+    Raises:
+        KeyError: If there is no viewport with that name.
+    """
+    return Viewport(**config.capture_viewports[name])
+
+
+class DiskCachePool:
+    """
+    Hands out persistent Chrome disk cache folders to concurrent captures.
+
+    Chrome cannot share one disk cache between running browsers, so every capture leases a
+    folder of its own for the lifetime of its browser. Folders are reused by later captures,
+    which is what keeps static assets warm between checks.
+
+    Attributes:
+        folder (str): Folder containing the cache folders.
+
+    Methods:
+        lease(self) -> Iterator[str]: Context manager holding a cache folder.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._free: list[str] = []
+        self._count = 0
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[str]:
+        """
+        Leases a cache folder until the end of the `with` block.
+
+        Yields:
+            str: The absolute path of the cache folder.
+        """
+        with self._lock:
+            if self._free:
+                path = self._free.pop()
+            else:
+                self._count += 1
+                path = os.path.abspath(
+                    os.path.join(self.folder, f'slot-{self._count}')
+                )
+        os.makedirs(path, exist_ok=True)
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._free.append(path)
+
+
+disk_caches = DiskCachePool(config.capture_disk_cache_folder)
+
+
+def apply_profile_options(
+    options: 'webdriver.ChromeOptions',
+    profile: CaptureProfile,
+    cache_dir: str | None,
+):
+    """
+    Adds the command line switches of a capture profile to the browser options.
+
+    Args:
+        options (webdriver.ChromeOptions): The options the browser is started with.
+        profile (CaptureProfile): The capture profile.
+        cache_dir (str | None): The leased disk cache folder, if the profile uses one.
+    """
+    if cache_dir:
+        options.add_argument(f'--disk-cache-dir={cache_dir}')
+    if profile.disable_animations:
+        options.add_argument('--autoplay-policy=user-gesture-required')
+
+
+def apply_profile_driver(
+    driver: 'webdriver.Chrome', profile: CaptureProfile, url: str
+):
+    """
+    Configures a started browser according to a capture profile, before any navigation.
+
+    Args:
+        driver (webdriver.Chrome): The started browser.
+        profile (CaptureProfile): The capture profile.
+        url (str): The URL of the tracked webpage, which is never blocked.
+    """
+    blocked_urls = profile.blocked_urls(url)
+    if blocked_urls:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    if profile.disable_animations:
+        driver.execute_cdp_cmd(
+            'Emulation.setEmulatedMedia',
+            {'features': [{'name': 'prefers-reduced-motion', 'value': 'reduce'}]},
+        )
+        driver.execute_cdp_cmd(
+            'Page.addScriptToEvaluateOnNewDocument', {'source': FREEZE_SCRIPT}
+        )
@@ -0,0 +1,243 @@
+"""
+Opt-in profiling of tracking checks.
+
+Profiling is switched on for the next N checks of one tracking or of all trackings. Each of
+these checks runs under cProfile and tracemalloc, and leaves two files in the profiles folder:
+a `.prof` file for pstats or snakeviz and a `.txt` report with the slowest functions and the
+top allocation sites. While no profiling is requested, the scheduler only reads one boolean
+per check.
+
+The switch lives in the process running the checks. Other processes, e.g. the web interface
+while the daemon runs the checks, leave a request file in the profiles folder, which the
+daemon picks up on its next sync.
+"""
+import contextlib
+import cProfile
+import datetime as dt
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+import config
+
+REQUEST_PREFIX = 'request-'
+
+
+class ProfileFile(BaseModel):
+    """
+    A file written by a profiled check.
+
+    Attributes:
+        name (str): The file name in the profiles folder.
+        size (int): Size of the file in bytes.
+        created_at (dt.datetime): When the file was written.
+    """
+    name: str
+    size: int
+    created_at: dt.datetime
+
+
+class CheckProfiler:
+    """
+    Counts down the checks left to profile and profiles them.
+
+    Attributes:
+        folder (str): Folder the profiles are written to.
+        pending (bool): Whether any check is still to be profiled. Read on every check, so
+                        it is kept as a plain attribute.
+
+    Methods:
+        enable(self, runs, tracking_id): Profiles the next `runs` checks.
+        disable(self): Cancels all pending profiling.
+        take(self, tracking_id) -> bool: Whether the current check should be profiled.
+        run(self, job, tr) -> Any: Runs a check under the profilers.
+        request(self, runs, tracking_id): Asks the process running the checks to profile.
+        poll_requests(self): Applies the requests left by other processes.
+        list_files(self) -> list[ProfileFile]: Lists the written profiles.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.pending = False
+        self._lock = threading.Lock()
+        # tracemalloc is process-wide, so profiled checks run one at a time
+        self._run_lock = threading.Lock()
+        self._global_runs = 0
+        self._tracking_runs: dict[int, int] = {}
+
+    def enable(self, runs: int, tracking_id: int | None = None):
+        """
+        Profiles the next `runs` checks of a tracking, or of any tracking.
+
+        Args:
+            runs (int): Number of checks to profile.
+            tracking_id (int | None): The ID of the tracking, or None for all trackings.
+        """
+        with self._lock:
+            if tracking_id is None:
+                self._global_runs = runs
+            else:
+                self._tracking_runs[tracking_id] = runs
+            self._update_pending()
+
+    def disable(self):
+        """
+        Cancels all pending profiling.
+        """
+        with self._lock:
+            self._global_runs = 0
+            self._tracking_runs.clear()
+            self._update_pending()
+
+    def take(self, tracking_id: int) -> bool:
+        """
+        Decides whether the current check of a tracking should be profiled, counting it down.
+
+        Args:
+            tracking_id (int): The ID of the tracking being checked.
+
+        Returns:
+            bool: True if the check should be profiled.
+        """
+        with self._lock:
+            if self._tracking_runs.get(tracking_id):
+                self._tracking_runs[tracking_id] -= 1
+                if not self._tracking_runs[tracking_id]:
+                    del self._tracking_runs[tracking_id]
+            elif self._global_runs:
+                self._global_runs -= 1
+            else:
+                return False
+            self._update_pending()
+            return True
+
+    def _update_pending(self):
+        self.pending = bool(self._global_runs or self._tracking_runs)
+
+    def run(self, job: Callable[[Any], Any], tr: Any) -> Any:
+        """
+        Runs one check under cProfile and tracemalloc and writes its profile.
+
+        The profile is written even if the check raises. Allocations of other threads made
+        during the check are counted by tracemalloc as well.
+
+        Args:
+            job (Callable[[Any], Any]): The check function.
+            tr (Any): The tracking to check, with an `id` and a `url`.
+
+        Returns:
+            Any: The result of the check.
+        """
+        with self._run_lock:
+            profiler = cProfile.Profile()
+            tracemalloc.start(config.profiling_traceback_frames)
+            started = time.perf_counter()
+            outcome = 'ok'
+            try:
+                profiler.enable()
+                try:
+                    return job(tr)
+                finally:
+                    profiler.disable()
+            except BaseException as exc:
+                outcome = type(exc).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self._write(tr, profiler, snapshot, peak, elapsed, outcome)
+
+    def _write(
+        self,
+        tr: Any,
+        profiler: cProfile.Profile,
+        snapshot: tracemalloc.Snapshot,
+        peak: int,
+        elapsed: float,
+        outcome: str,
+    ):
+        os.makedirs(self.folder, exist_ok=True)
+        name = f'{dt.datetime.now().strftime("%Y-%m-%d %H%M%S")} tracking-{tr.id}'
+        base = os.path.join(self.folder, name)
+        profiler.dump_stats(base + '.prof')
+        report = io.StringIO()
+        report.write(f'{tr.url}\nwall time: {elapsed:.3f} s, result: {outcome}\n')
+        report.write(f'peak traced memory: {peak / 2**20:.1f} MB\n\n')
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+            config.profiling_top_functions
+        )
+        report.write('Top allocation sites:\n')
+        for stat in snapshot.statistics('lineno')[: config.profiling_top_allocations]:
+            report.write(f'{stat}\n')
+        with open(base + '.txt', 'w', encoding='utf-8') as file:
+            file.write(report.getvalue())
+
+    def request(self, runs: int, tracking_id: int | None = None):
+        """
+        Asks the process running the checks to profile the next `runs` checks.
+
+        Args:
+            runs (int): Number of checks to profile, 0 to cancel all profiling.
+            tracking_id (int | None): The ID of the tracking, or None for all trackings.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f'{REQUEST_PREFIX}{uuid.uuid4().hex}.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'runs': runs, 'tracking_id': tracking_id}, file)
+        os.replace(path + '.tmp', path)
+
+    def poll_requests(self):
+        """
+        Applies and removes the profiling requests left in the profiles folder.
+        """
+        if not os.path.isdir(self.folder):
+            return
+        for name in sorted(os.listdir(self.folder)):
+            if not (name.startswith(REQUEST_PREFIX) and name.endswith('.json')):
+                continue
+            path = os.path.join(self.folder, name)
+            with contextlib.suppress(OSError, ValueError, KeyError):
+                with open(path) as file:
+                    request = json.load(file)
+                if request['runs']:
+                    self.enable(request['runs'], request['tracking_id'])
+                else:
+                    self.disable()
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def list_files(self) -> list[ProfileFile]:
+        """
+        Lists the profiles written so far, newest first.
+
+        Returns:
+            list[ProfileFile]: The `.prof` and `.txt` files in the profiles folder.
+        """
+        if not os.path.isdir(self.folder):
+            return []
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(('.prof', '.txt')):
+                    stat = entry.stat()
+                    files.append(
+                        ProfileFile(
+                            name=entry.name,
+                            size=stat.st_size,
+                            created_at=dt.datetime.fromtimestamp(stat.st_mtime),
+                        )
+                    )
+        return sorted(files, key=lambda file: file.created_at, reverse=True)
+
+
+profiler = CheckProfiler(config.profiling_folder)
@@ -1,9 +1,18 @@
+import datetime as dt
+import functools
+import importlib
+from typing import Any, Callable
+
 from apscheduler.job import Job
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
 
+import config
 from db.schemas import TrackingSchema
 
-from .states import update_state, create_states_folder
+from .admission import CaptureDeferred
+from .profiling import profiler
+from .states import update_state
 
 
 class MyScheduler:
@@ -17,49 +26,109 @@ class MyScheduler:
     Attributes:
         _scheduler (BackgroundScheduler): An instance of APScheduler's BackgroundScheduler
                                           used for scheduling tracking updates.
+        _job (Callable[[TrackingSchema], Any]): The function run for every tracking check.
+        _defer_delay (float): Seconds after which a check deferred for lack of memory is retried.
 
     Methods:
-        __init__(self): Initializes a new MyScheduler instance with a BackgroundScheduler.
-        add_tracking(self, tr: TrackingSchema) -> Job: Adds a new tracking job to the scheduler.
+        __init__(self, job, max_workers, max_instances, defer_delay, misfire_grace_time): Initializes a new MyScheduler instance
+            with a BackgroundScheduler.
+        add_tracking(self, tr: TrackingSchema, start_date) -> Job: Adds a new tracking job to the scheduler.
+        add_trackings(self, trs: list[TrackingSchema]) -> list[Job]: Adds many tracking jobs with
+            their first runs spread out.
         remove_tracking_by_id(self, tr_id: int): Removes a tracking job from the scheduler by its ID.
+        sync(self, trs: list[TrackingSchema]) -> tuple[int, int]: Adds and removes jobs to match
+            the given trackings.
+        add_periodic(self, func, seconds, id) -> Job: Adds a maintenance job.
         get_all_jobs(self) -> list[Job]: Returns a list of all scheduled tracking jobs.
+        add_listener(self, callback, mask): Subscribes to APScheduler events.
+        shutdown(self, wait: bool): Stops the scheduler.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        job: Callable[[TrackingSchema], Any] = update_state,
+        max_workers: int = config.scheduler_max_workers,
+        max_instances: int = config.scheduler_max_instances,
+        defer_delay: float = config.capture_defer_delay,
+        misfire_grace_time: int | None = 1,
+    ):
         """
         Initializes the MyScheduler instance.
 
-        Creates a BackgroundScheduler with a specific configuration that limits the maximum
-        number of instances of each job to 10. It starts the scheduler immediately upon
-        initialization.
+        Creates a BackgroundScheduler whose thread pool has `max_workers` threads and which
+        limits the maximum number of concurrently running instances of each job to
+        `max_instances`. It starts the scheduler immediately upon initialization.
+
+        Args:
+            job (Callable[[TrackingSchema], Any]): The function run for every tracking check.
+                Defaults to `update_state`; the load simulator replaces it with a stub.
+            max_workers (int): Size of the thread pool running the checks.
+            max_instances (int): Maximum number of overlapping runs of one tracking.
+            defer_delay (float): Seconds after which a check that raised CaptureDeferred
+                is retried.
+            misfire_grace_time (int | None): Whole seconds a check may start late before it
+                is dropped as missed, or None to never drop late checks. Defaults to
+                APScheduler's own default.
         """
+        self._job = job
+        self._defer_delay = defer_delay
         self._scheduler = BackgroundScheduler(
-            {'apscheduler.job_defaults.max_instances': 10}
+            {
+                'apscheduler.executors.default': {
+                    'class': 'apscheduler.executors.pool:ThreadPoolExecutor',
+                    'max_workers': str(max_workers),
+                },
+                'apscheduler.job_defaults.max_instances': max_instances,
+                'apscheduler.job_defaults.misfire_grace_time': misfire_grace_time,
+            }
         )
         self._scheduler.start()
 
-    def add_tracking(self, tr: TrackingSchema) -> Job:
+    def add_tracking(
+        self, tr: TrackingSchema, start_date: dt.datetime | None = None
+    ) -> Job:
         """
         Adds a new tracking job to the scheduler.
 
         This method schedules a new job to update the state of a tracking entry at the interval
-        specified in the TrackingSchema. It also ensures that the necessary folder structure
-        for storing state information is created before scheduling the job.
+        specified in the TrackingSchema.
 
         Args:
             tr (TrackingSchema): The tracking entry to be updated by the scheduled job.
+            start_date (dt.datetime | None): Time of the first check. Defaults to one interval
+                from now.
 
         Returns:
             Job: The job instance that was added to the scheduler.
         """
-        create_states_folder(tr)
         return self._scheduler.add_job(
-            update_state,
+            self._run,
             'interval',
             args=[tr],
-            seconds=tr.interval.seconds,
+            seconds=tr.interval.total_seconds(),
+            start_date=start_date,
             id=str(tr.id),
         )
 
+    def add_trackings(self, trs: list[TrackingSchema]) -> list[Job]:
+        """
+        Adds many tracking jobs to the scheduler with their first checks spread out.
+
+        The first check of the i-th of n trackings runs after (i + 1) / n of its interval, so
+        trackings added together do not all fall due at the same moment and keep their checks
+        spread out afterwards.
+
+        Args:
+            trs (list[TrackingSchema]): The tracking entries to be updated by the scheduled jobs.
+
+        Returns:
+            list[Job]: The job instances that were added to the scheduler.
+        """
+        now = dt.datetime.now()
+        return [
+            self.add_tracking(tr, now + tr.interval * (i + 1) / len(trs))
+            for i, tr in enumerate(trs)
+        ]
+
     def remove_tracking_by_id(self, tr_id: int):
         """
         Removes a tracking job from the scheduler by its ID.
@@ -71,6 +140,82 @@ class MyScheduler:
             tr_id (int): The ID of the tracking job to be removed.
         """
         self._scheduler.remove_job(str(tr_id))
+        try:
+            self._scheduler.remove_job(f'{tr_id}-deferred')
+        except JobLookupError:
+            pass
+
+    def sync(self, trs: list[TrackingSchema]) -> tuple[int, int]:
+        """
+        Brings the scheduled jobs in line with the given list of trackings.
+
+        Trackings without a job are added with their first checks spread out, and jobs of
+        trackings that are not in the list any more are removed. Used by the daemon to pick up
+        trackings added or deleted by another process.
+
+        Args:
+            trs (list[TrackingSchema]): All tracking entries that should be checked.
+
+        Returns:
+            tuple[int, int]: Numbers of added and removed tracking jobs.
+        """
+        # tracking jobs are named by the tracking ID, deferred and maintenance jobs are not
+        scheduled = {job.id for job in self.get_all_jobs() if job.id.isdigit()}
+        wanted = {str(tr.id) for tr in trs}
+        added = self.add_trackings([tr for tr in trs if str(tr.id) not in scheduled])
+        removed = scheduled - wanted
+        for job_id in removed:
+            self.remove_tracking_by_id(int(job_id))
+        return len(added), len(removed)
+
+    def add_periodic(
+        self, func: Callable[[], Any] | str, seconds: float, id: str
+    ) -> Job:
+        """
+        Adds a maintenance job that is not tied to a tracking, e.g. archiving old states.
+
+        Args:
+            func (Callable[[], Any] | str): The function to run, or a `module:function`
+                reference, which delays importing the module until the first run.
+                APScheduler would resolve a reference as soon as the job is added, so it
+                is wrapped and resolved by `_call_ref` on every run instead.
+            seconds (float): Interval between two runs.
+            id (str): The ID of the job; must not be a number, which is reserved for trackings.
+
+        Returns:
+            Job: The job instance that was added to the scheduler.
+        """
+        if isinstance(func, str):
+            func = functools.partial(_call_ref, func)
+        return self._scheduler.add_job(
+            func, 'interval', seconds=seconds, id=id, replace_existing=True
+        )
+
+    def _run(self, tr: TrackingSchema):
+        """
+        Runs one check of a tracking, requeueing it if the check is deferred.
+
+        A check deferred for lack of memory headroom is scheduled to run once more after
+        `_defer_delay` seconds instead of failing. Only one deferred run per tracking is kept.
+        While profiling is requested, the check runs under the profiler.
+
+        Args:
+            tr (TrackingSchema): The tracking entry to be updated.
+        """
+        try:
+            if profiler.pending and profiler.take(tr.id):
+                profiler.run(self._job, tr)
+            else:
+                self._job(tr)
+        except CaptureDeferred:
+            self._scheduler.add_job(
+                self._run,
+                'date',
+                args=[tr],
+                run_date=dt.datetime.now() + dt.timedelta(seconds=self._defer_delay),
+                id=f'{tr.id}-deferred',
+                replace_existing=True,
+            )
 
     def get_all_jobs(self) -> list[Job]:
         """
@@ -83,3 +228,28 @@ class MyScheduler:
             list[Job]: A list of all jobs currently scheduled in the scheduler.
         """
         return self._scheduler.get_jobs()
+
+    def add_listener(self, callback: Callable[[Any], None], mask: int):
+        """
+        Subscribes a callback to events of the underlying BackgroundScheduler.
+
+        Args:
+            callback (Callable[[Any], None]): Function called with every matching event.
+            mask (int): Bitmask of `apscheduler.events` codes to listen for.
+        """
+        self._scheduler.add_listener(callback, mask)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the scheduler.
+
+        Args:
+            wait (bool): Whether to wait for running checks to finish.
+        """
+        self._scheduler.shutdown(wait=wait)
+
+
+def _call_ref(ref: str) -> Any:
+    # imports the module of a `module:function` reference only when the job runs
+    module, name = ref.split(':')
+    return getattr(importlib.import_module(module), name)()
@@ -0,0 +1,308 @@
+"""
+Load simulator for MyScheduler.
+
+Registers thousands of synthetic trackings with mixed intervals in a real MyScheduler whose
+check function is replaced with a stub of configurable service time, runs it on an accelerated
+clock and reports scheduling lag, missed runs, overlapping instances and thread pool saturation.
+
+Usage:
+    python -m comparer.simulation --trackings 5000 --duration 3600 --speedup 60 --service-time 20
+"""
+import argparse
+import datetime as dt
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from apscheduler.events import (
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+)
+from pydantic import BaseModel
+
+import config
+from db.schemas import TrackingSchema
+
+from .scheduler import MyScheduler
+
+# check intervals in seconds the synthetic trackings are drawn from
+DEFAULT_INTERVALS = (30, 60, 300, 600, 1800, 3600)
+# APScheduler's default misfire grace time in seconds, the one MyScheduler runs with
+MISFIRE_GRACE_TIME = 1
+
+
+class SimulationReport(BaseModel):
+    """
+    Result of a scheduler load simulation. All durations are in simulated seconds.
+
+    Attributes:
+        trackings (int): Number of synthetic trackings registered.
+        duration (float): Simulated time span.
+        max_workers (int): Size of the scheduler's thread pool.
+        max_instances (int): Maximum number of overlapping runs of one tracking.
+        expected_runs (int): Number of runs the intervals ask for during the simulation.
+        runs (int): Number of runs that started in time.
+        missed_runs (int): Runs that started later than the misfire grace time, which
+                           APScheduler drops in production.
+        skipped_overlapping_runs (int): Runs dropped because `max_instances` was reached.
+        max_overlapping_instances (int): Highest number of simultaneous runs of one tracking.
+        lag_p50 (float): Median delay between the scheduled and the actual start of a run,
+                         including missed runs.
+        lag_p95 (float): 95th percentile of the start delay.
+        lag_max (float): Largest start delay.
+        peak_in_flight (int): Highest number of runs executing at once.
+        saturated_share (float): Share of started runs, missed ones included, that started
+                                 while every worker was busy.
+        utilization (float): Share of the pool's capacity spent running checks.
+    """
+    trackings: int
+    duration: float
+    max_workers: int
+    max_instances: int
+    expected_runs: int
+    runs: int
+    missed_runs: int
+    skipped_overlapping_runs: int
+    max_overlapping_instances: int
+    lag_p50: float
+    lag_p95: float
+    lag_max: float
+    peak_in_flight: int
+    saturated_share: float
+    utilization: float
+
+    def __str__(self) -> str:
+        return '\n'.join(f'{name}: {value}' for name, value in self)
+
+
+class SchedulerSimulation:
+    """
+    A MyScheduler load simulation on an accelerated clock.
+
+    Intervals and service times are divided by `speedup` before they reach the scheduler and
+    every measured duration is multiplied back, so one real second stands for `speedup`
+    simulated seconds. APScheduler only takes whole seconds as misfire grace time, which
+    cannot be scaled down, so the scheduler runs every late check, and a run is counted as
+    missed afterwards if it started more than MISFIRE_GRACE_TIME simulated seconds late. In
+    production such a run is dropped without occupying a worker, and APScheduler's own
+    overhead is not scaled either, so very high speedups make the results pessimistic.
+
+    The trackings are registered with `add_trackings`, like the web interface and the daemon
+    do at startup, so their first checks are spread over their intervals.
+
+    Attributes:
+        speedup (float): How many simulated seconds pass per real second.
+        service_time (float): Mean simulated duration of one check.
+        jitter (float): Relative spread of the service time around its mean.
+        slow_share (float): Share of trackings whose checks are `slow_factor` times slower,
+                            standing in for hung or very heavy sites.
+        slow_factor (float): Service time multiplier of the slow trackings.
+        max_workers (int): Size of the scheduler's thread pool.
+        max_instances (int): Maximum number of overlapping runs of one tracking.
+
+    Methods:
+        run(self, trackings, duration, intervals, seed) -> SimulationReport: Runs the simulation.
+    """
+    def __init__(
+        self,
+        speedup: float = 60,
+        service_time: float = 20,
+        jitter: float = 0.5,
+        slow_share: float = 0,
+        slow_factor: float = 10,
+        max_workers: int = config.scheduler_max_workers,
+        max_instances: int = config.scheduler_max_instances,
+    ):
+        self.speedup = speedup
+        self.service_time = service_time
+        self.jitter = jitter
+        self.slow_share = slow_share
+        self.slow_factor = slow_factor
+        self.max_workers = max_workers
+        self.max_instances = max_instances
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._slow_ids: set[int] = set()
+        self._running: dict[int, int] = defaultdict(int)
+        self._in_flight = 0
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._lags: list[float] = []
+        self._runs = 0
+        self._missed = 0
+        self._skipped = 0
+        self._max_overlap = 0
+        self._peak_in_flight = 0
+        self._saturated_starts = 0
+        self._busy_time = 0.0
+
+    def _check_stub(self, tr: TrackingSchema):
+        """Stands in for `update_state`: records the start and sleeps for the service time."""
+        started = dt.datetime.now(dt.timezone.utc)
+        if not hasattr(self._local, 'starts'):
+            self._local.starts = []
+        self._local.starts.append(started)
+        with self._lock:
+            self._runs += 1
+            self._in_flight += 1
+            self._running[tr.id] += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._max_overlap = max(self._max_overlap, self._running[tr.id])
+            if self._in_flight >= self.max_workers:
+                self._saturated_starts += 1
+        service_time = self.service_time * random.uniform(
+            1 - self.jitter, 1 + self.jitter
+        )
+        if tr.id in self._slow_ids:
+            service_time *= self.slow_factor
+        time.sleep(service_time / self.speedup)
+        with self._lock:
+            self._in_flight -= 1
+            self._running[tr.id] -= 1
+            self._busy_time += service_time
+
+    def _on_event(self, event):
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            with self._lock:
+                self._skipped += 1
+        elif event.code == EVENT_JOB_EXECUTED:
+            # executed events are dispatched from the worker thread that ran the stub
+            starts = getattr(self._local, 'starts', None)
+            if starts:
+                lag = (starts.pop(0) - event.scheduled_run_time).total_seconds()
+                lag = max(lag, 0.0) * self.speedup
+                with self._lock:
+                    self._lags.append(lag)
+                    if lag > MISFIRE_GRACE_TIME:
+                        self._missed += 1
+
+    def run(
+        self,
+        trackings: int,
+        duration: float,
+        intervals: tuple[int, ...] = DEFAULT_INTERVALS,
+        seed: int | None = None,
+    ) -> SimulationReport:
+        """
+        Registers synthetic trackings and lets the scheduler run them for `duration`.
+
+        Args:
+            trackings (int): Number of synthetic trackings to register.
+            duration (float): Simulated time span in seconds.
+            intervals (tuple[int, ...]): Check intervals in seconds the trackings are drawn from.
+            seed (int | None): Seed for the interval, slowness and service time draws.
+
+        Returns:
+            SimulationReport: The measured scheduler behaviour.
+        """
+        random.seed(seed)
+        self._reset_metrics()
+        now = dt.datetime.now()
+        sim_intervals = [random.choice(intervals) for _ in range(trackings)]
+        self._slow_ids = {
+            tr_id
+            for tr_id in range(1, trackings + 1)
+            if random.random() < self.slow_share
+        }
+        scheduler = MyScheduler(
+            job=self._check_stub,
+            max_workers=self.max_workers,
+            max_instances=self.max_instances,
+            misfire_grace_time=None,
+        )
+        scheduler.add_listener(
+            self._on_event,
+            EVENT_JOB_EXECUTED | EVENT_JOB_MAX_INSTANCES,
+        )
+        scheduler.add_trackings(
+            [
+                TrackingSchema(
+                    id=tr_id,
+                    url=f'https://site{tr_id}.example.com/',
+                    interval=dt.timedelta(seconds=interval / self.speedup),
+                    created_at=now,
+                    save_all_screenshots=False,
+                    last_state=None,
+                )
+                for tr_id, interval in enumerate(sim_intervals, start=1)
+            ]
+        )
+        time.sleep(duration / self.speedup)
+        scheduler.shutdown(wait=False)
+        with self._lock:
+            lags = sorted(self._lags)
+            return SimulationReport(
+                trackings=trackings,
+                duration=duration,
+                max_workers=self.max_workers,
+                max_instances=self.max_instances,
+                expected_runs=sum(int(duration // i) for i in sim_intervals),
+                runs=self._runs - self._missed,
+                missed_runs=self._missed,
+                skipped_overlapping_runs=self._skipped,
+                max_overlapping_instances=self._max_overlap,
+                lag_p50=_percentile(lags, 0.5),
+                lag_p95=_percentile(lags, 0.95),
+                lag_max=lags[-1] if lags else 0.0,
+                peak_in_flight=self._peak_in_flight,
+                saturated_share=(
+                    self._saturated_starts / self._runs if self._runs else 0.0
+                ),
+                utilization=self._busy_time / (self.max_workers * duration),
+            )
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate MyScheduler under a synthetic tracking load.'
+    )
+    parser.add_argument('--trackings', type=int, default=1000)
+    parser.add_argument(
+        '--duration', type=float, default=3600, help='simulated seconds'
+    )
+    parser.add_argument(
+        '--speedup', type=float, default=60, help='simulated seconds per real second'
+    )
+    parser.add_argument(
+        '--service-time', type=float, default=20, help='mean check duration in seconds'
+    )
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--slow-share', type=float, default=0)
+    parser.add_argument('--slow-factor', type=float, default=10)
+    parser.add_argument(
+        '--intervals',
+        type=lambda s: tuple(int(i) for i in s.split(',')),
+        default=DEFAULT_INTERVALS,
+        help='comma separated check intervals in seconds',
+    )
+    parser.add_argument('--max-workers', type=int, default=config.scheduler_max_workers)
+    parser.add_argument(
+        '--max-instances', type=int, default=config.scheduler_max_instances
+    )
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    # every missed and skipped run is counted in the report instead of logged
+    logging.getLogger('apscheduler').setLevel(logging.ERROR)
+    simulation = SchedulerSimulation(
+        speedup=args.speedup,
+        service_time=args.service_time,
+        jitter=args.jitter,
+        slow_share=args.slow_share,
+        slow_factor=args.slow_factor,
+        max_workers=args.max_workers,
+        max_instances=args.max_instances,
+    )
+    print(simulation.run(args.trackings, args.duration, args.intervals, args.seed))
+
+
+if __name__ == '__main__':
+    main()
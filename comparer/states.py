@@ -1,13 +1,13 @@
+import contextlib
 import datetime as dt
+import logging
 import os
 import asyncio
+import threading
+from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 
-from PIL import Image, ImageChops
-from selenium import webdriver
-
 import config
-from notifications.tgbot import send_message
 from db.schemas import (
     TrackingSchema,
     WebPageStateCreateSchema,
@@ -15,6 +15,38 @@ from db.schemas import (
 )
 from db.utils import create_new_website_state, get_tracking_by_id
 
+from .admission import AdmissionController, CaptureDeferred, CaptureSlot
+from .breaker import CircuitBreaker
+from .captures import Capture, CaptureCache
+from .profiles import (
+    apply_profile_driver,
+    apply_profile_options,
+    disk_caches,
+    get_capture_profile,
+    get_viewport,
+)
+
+# Selenium, PIL and python-telegram-bot are imported in the functions using them, so that
+# processes which never capture or compare screenshots do not pay for loading them
+if TYPE_CHECKING:
+    from selenium import webdriver
+
+logger = logging.getLogger(__name__)
+
+breaker = CircuitBreaker(
+    config.capture_breaker_failures, config.capture_breaker_cooldown
+)
+admission = AdmissionController(
+    config.capture_min_free_memory_mb,
+    config.capture_max_in_flight,
+    config.capture_memory_estimate_mb,
+)
+captures = CaptureCache(
+    config.screenshots_folder + '.cache/',
+    config.capture_cache_freshness,
+    config.capture_per_host_limit,
+)
+
 
 def get_states_folder_name(tr: TrackingSchema) -> str:
     """
@@ -33,7 +65,7 @@ def get_states_folder_name(tr: TrackingSchema) -> str:
     return str(tr.id) + str(urlparse(tr.url).hostname) + '/'
 
 
-def update_state(tr: TrackingSchema) -> WebPageStateSchema | None:
+def update_state(tr: TrackingSchema) -> list[WebPageStateSchema]:
     """
     Updates the state of a tracked webpage by taking a new screenshot, comparing it with the
     previous state, and saving the new state if changes are detected.
@@ -42,68 +74,347 @@ def update_state(tr: TrackingSchema) -> WebPageStateSchema | None:
     it with the last saved state, and updates the database with the new state if any changes
     are detected. If the webpage has changed, a notification is sent via Telegram.
 
+    Every viewport of the tracking gets a screenshot, a comparison and a state of its own;
+    a tracking without viewports has one, at the page's own width.
+
+    A recent capture of the same webpage made for another tracking is reused instead of
+    rendering the webpage again, and screenshots whose fingerprint matches the last state are
+    treated as unchanged without decoding them. For a changed screenshot, the comparison
+    writes an overlay with the changed regions highlighted and a close-up of the largest
+    one; the notification sends these instead of the full screenshot.
+
+    A failed capture is saved as a state with an error instead of being raised. Browser and
+    network failures count towards the circuit breaker of the webpage's host, other failures
+    do not, since they say nothing about the host. While the breaker is open the check is
+    skipped altogether. A tracking with a viewport missing from the settings is not captured
+    at all; every viewport gets a state with an error instead.
+
     Args:
         tr (TrackingSchema): The tracking information for the webpage to be updated.
 
     Returns:
-        WebPageStateSchema | None: The new webpage state if changes are detected and saved,
-                                   otherwise None.
+        list[WebPageStateSchema]: The new webpage states, one per viewport, or an empty list if
+                                  the check was skipped.
+
+    Raises:
+        CaptureDeferred: If the host has no memory headroom for a new capture; the check
+                         should be requeued.
     """
-    screenshot_path = screenshot(tr)
+    from selenium.common.exceptions import WebDriverException
+    from urllib3.exceptions import HTTPError
+
+    viewports = tr.viewports or [None]
+    unknown = [name for name in tr.viewports if name not in config.capture_viewports]
+    if unknown:
+        return _save_errors(tr, ValueError(f'Unknown viewport {unknown[0]!r}'))
+    host = str(urlparse(tr.url).hostname)
+    if not breaker.allow(host):
+        return []
+    try:
+        shots = captures.get(tr, screenshot, new_screenshot_path)
+    except CaptureDeferred:
+        raise
+    except (WebDriverException, HTTPError, TimeoutError) as exc:
+        breaker.record_failure(host)
+        return _save_errors(tr, exc)
+    except Exception as exc:
+        return _save_errors(tr, exc)
+    breaker.record_success(host)
     tr_last = get_tracking_by_id(tr.id)
     if not tr_last:
-        return
-    if tr_last.last_state:
+        return []
+    last_states = {state.viewport: state for state in tr_last.last_states}
+    return [
+        _save_state(tr, viewport, shots[viewport], last_states.get(viewport))
+        for viewport in viewports
+    ]
+
+
+def _save_errors(tr: TrackingSchema, exc: Exception) -> list[WebPageStateSchema]:
+    """
+    Saves a failed check as a state with an error for every viewport of the tracking.
+
+    Args:
+        tr (TrackingSchema): The tracking information.
+        exc (Exception): The reason the check failed.
+
+    Returns:
+        list[WebPageStateSchema]: The new webpage states, or an empty list if the tracking was
+                                  deleted in the meantime.
+    """
+    if not get_tracking_by_id(tr.id):
+        return []
+    return [
+        create_new_website_state(
+            WebPageStateCreateSchema(
+                tracking_id=tr.id,
+                viewport=viewport,
+                error=describe_error(exc),
+            )
+        )
+        for viewport in tr.viewports or [None]
+    ]
+
+
+def _save_state(
+    tr: TrackingSchema,
+    viewport: str | None,
+    capture: Capture,
+    last_state: WebPageStateSchema | None,
+) -> WebPageStateSchema:
+    """
+    Compares a new screenshot of one viewport with its last state and saves the new state
+    together with the overlay artifacts of the change, if there is one. The state is saved
+    even if the notification cannot be sent.
+
+    Args:
+        tr (TrackingSchema): The tracking information.
+        viewport (str | None): The name of the viewport, or None for the page's own width.
+        capture (Capture): The new screenshot.
+        last_state (WebPageStateSchema | None): The last state of the viewport, if any.
+
+    Returns:
+        WebPageStateSchema: The new webpage state.
+    """
+    screenshot_path = capture.path
+    overlay_filename = closeup_filename = None
+    if last_state:
         # compare
-        prev = Image.open(tr_last.last_state.image_filename)
-        curr = Image.open(screenshot_path)
-        diff = ImageChops.difference(prev, curr)
-        is_different = bool(diff.getbbox())
-        if not tr.save_all_screenshots and not is_different:
+        overlay = None
+        if capture.fingerprint != last_state.fingerprint:
+            from .overlays import diff_screenshots
+
+            overlay = diff_screenshots(last_state.image_filename, screenshot_path)
+        if overlay:
+            from telegram.error import TelegramError
+
+            from notifications.tgbot import send_photos
+
+            overlay_filename = overlay.overlay_filename
+            closeup_filename = overlay.closeup_filename
+            message = f'Сайт {tr.url} изменился'
+            if viewport:
+                message += f' ({viewport})'
+            try:
+                asyncio.run(send_photos(message, [overlay_filename, closeup_filename]))
+            except (TelegramError, ValueError):
+                logger.exception('Could not notify about a change of tracking %d', tr.id)
+        elif not tr.save_all_screenshots:
             os.remove(screenshot_path)
-            screenshot_path = tr_last.last_state.image_filename
-        if is_different:
-            asyncio.run(
-                send_message(f'Сайт {tr.url} изменился', screenshot_path)
-            )
+            screenshot_path = last_state.image_filename
+            # the screenshot is the same file, so is the last change drawn on it
+            overlay_filename = last_state.overlay_filename
+            closeup_filename = last_state.closeup_filename
     return create_new_website_state(
         WebPageStateCreateSchema(
             tracking_id=tr.id,
+            viewport=viewport,
             image_filename=screenshot_path,
+            fingerprint=capture.fingerprint,
+            overlay_filename=overlay_filename,
+            closeup_filename=closeup_filename,
         )
     )
 
 
-def screenshot(tr: TrackingSchema) -> str:
+def describe_error(exc: Exception) -> str:
+    """
+    Builds a short description of a capture failure that fits into a state row.
+
+    Args:
+        exc (Exception): The exception raised by the capture.
+
+    Returns:
+        str: The exception type and the first line of its message.
+    """
+    lines = f'{type(exc).__name__}: {exc}'.strip().splitlines()
+    return lines[0][:255]
+
+
+def screenshot(tr: TrackingSchema) -> dict[str | None, str]:
     """
     Takes a screenshot of a webpage specified in the TrackingSchema.
 
     This function initializes a headless Chrome browser, navigates to the URL specified in the
-    TrackingSchema, and takes a full-page screenshot of the webpage. The screenshot is saved
-    to a file whose path is constructed based on the tracking information and current timestamp.
+    TrackingSchema, and takes a full-page screenshot of the webpage in every viewport of the
+    tracking. The screenshots are saved to files whose paths are built by
+    `new_screenshot_path`.
+
+    Navigation and scripts are limited by the configured page load and script timeouts. The
+    whole capture is limited by the check timeout: when it runs out, the chromedriver service
+    is stopped, which ends the browser and makes the pending browser command fail.
+
+    The browser is set up according to the tracking's capture profile: blocked requests, a
+    shared disk cache for static assets and frozen animations.
+
+    The capture runs only if the admission controller finds memory headroom for another
+    browser, and the memory of the browser's processes is accounted to it while it runs.
 
     Args:
         tr (TrackingSchema): The tracking information, including the URL of the webpage.
 
     Returns:
-        str: The file path of the saved screenshot.
+        dict[str | None, str]: The file path of the saved screenshot by viewport name, with
+                               None for the page's own width.
+
+    Raises:
+        CaptureDeferred: If the host has no memory headroom for another browser.
+        TimeoutError: If the capture takes longer than the check timeout.
+        WebDriverException: If the browser fails to load or capture the webpage.
     """
+    from selenium import webdriver
+
+    profile = get_capture_profile(tr.capture_profile)
     service = webdriver.ChromeService(executable_path=r'./chromedriver.exe')
     options = webdriver.ChromeOptions()
     options.add_argument('--headless=new')
-    with webdriver.Chrome(options, service) as driver:
-        driver.get(tr.url)
-        scroll_w = driver.execute_script(
-            'return document.body.parentNode.scrollWidth'
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        service.stop()
+
+    with admission.admit() as slot, (
+        disk_caches.lease() if profile.disk_cache else contextlib.nullcontext()
+    ) as cache_dir:
+        apply_profile_options(options, profile, cache_dir)
+        watchdog = threading.Timer(config.capture_check_timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            with webdriver.Chrome(options, service) as driver:
+                slot.register(service.process.pid)
+                driver.set_page_load_timeout(config.capture_page_load_timeout)
+                driver.set_script_timeout(config.capture_script_timeout)
+                apply_profile_driver(driver, profile, tr.url)
+                return _capture(tr, driver, slot)
+        except Exception as exc:
+            if expired.is_set():
+                raise TimeoutError(
+                    f'Check exceeded {config.capture_check_timeout} s'
+                ) from exc
+            raise
+        finally:
+            watchdog.cancel()
+
+
+def _capture(
+    tr: TrackingSchema, driver: 'webdriver.Chrome', slot: CaptureSlot
+) -> dict[str | None, str]:
+    """
+    Loads the tracked webpage in the browser and saves a full-page screenshot of it in every
+    viewport of the tracking.
+
+    The webpage is loaded once and every viewport is emulated in turn on the loaded page. A
+    tracking without viewports gets one screenshot at the page's own width.
+
+    Args:
+        tr (TrackingSchema): The tracking information, including the URL of the webpage.
+        driver (webdriver.Chrome): The browser to load the webpage in.
+        slot (CaptureSlot): The admission slot the browser's memory is accounted to.
+
+    Returns:
+        dict[str | None, str]: The file path of the saved screenshot by viewport name, with
+                               None for the page's own width.
+    """
+    driver.get(tr.url)
+    paths = {}
+    for viewport in tr.viewports or [None]:
+        paths[viewport] = _capture_viewport(tr, driver, viewport)
+        # the full-page screenshot is the memory peak of a capture
+        slot.sample()
+    return paths
+
+
+def _capture_viewport(
+    tr: TrackingSchema, driver: 'webdriver.Chrome', viewport: str | None
+) -> str:
+    """
+    Saves a full-page screenshot of the loaded webpage in one viewport.
+
+    The page is cut at the tracking's height cap, or the global one if the tracking has none.
+    Pages taller than the tile threshold are captured tile by tile with a fixed viewport
+    instead of resizing the viewport to the whole page.
+
+    Args:
+        tr (TrackingSchema): The tracking information.
+        driver (webdriver.Chrome): The browser with the loaded webpage.
+        viewport (str | None): The name of the viewport, or None for the page's own width.
+
+    Returns:
+        str: The file path of the saved screenshot.
+    """
+    if viewport:
+        device = get_viewport(viewport)
+        driver.execute_cdp_cmd(
+            'Emulation.setDeviceMetricsOverride',
+            {
+                'width': device.width,
+                'height': device.height,
+                'deviceScaleFactor': device.device_scale_factor,
+                'mobile': device.mobile,
+            },
+        )
+    scroll_w = driver.execute_script(
+        'return document.body.parentNode.scrollWidth'
+    )
+    scroll_h = driver.execute_script(
+        'return document.body.parentNode.scrollHeight'
+    )
+    max_height = tr.max_height or config.capture_max_height
+    if max_height:
+        scroll_h = min(scroll_h, max_height)
+    filepath = new_screenshot_path(tr, viewport)
+    width = device.width if viewport else scroll_w
+    scale = device.device_scale_factor if viewport else 1
+    mobile = device.mobile if viewport else False
+    if width and scroll_h > config.capture_tile_threshold:
+        from .tiling import save_tiled_screenshot
+
+        save_tiled_screenshot(
+            driver,
+            filepath,
+            width,
+            scroll_h,
+            config.capture_tile_height,
+            scale,
+            mobile,
         )
-        scroll_h = driver.execute_script(
-            'return document.body.parentNode.scrollHeight'
+    elif viewport:
+        driver.execute_cdp_cmd(
+            'Emulation.setDeviceMetricsOverride',
+            {
+                'width': width,
+                'height': scroll_h or device.height,
+                'deviceScaleFactor': scale,
+                'mobile': mobile,
+            },
         )
+        driver.save_screenshot(filepath)
+    else:
         if scroll_h != 0 and scroll_w != 0:
             driver.set_window_size(scroll_w, scroll_h)
-        filepath = f'{config.screenshots_folder}{get_states_folder_name(tr)}{dt.datetime.now().strftime(r"%d-%m-%Y %H%M%S")}.png'
         driver.save_screenshot(filepath)
-        return filepath
+    return filepath
+
+
+def new_screenshot_path(tr: TrackingSchema, viewport: str | None = None) -> str:
+    """
+    Builds the file path for a new screenshot of a tracked webpage.
+
+    The path points into the tracking's states folder, which is created if it does not exist
+    yet, and is named after the current timestamp and the viewport.
+
+    Args:
+        tr (TrackingSchema): The tracking information, used to generate the folder name.
+        viewport (str | None): The name of the viewport, or None for the page's own width.
+
+    Returns:
+        str: The file path for the new screenshot.
+    """
+    create_states_folder(tr)
+    suffix = f' {viewport}' if viewport else ''
+    return f'{config.screenshots_folder}{get_states_folder_name(tr)}{dt.datetime.now().strftime(r"%d-%m-%Y %H%M%S")}{suffix}.png'
 
 
 def create_states_folder(tr: TrackingSchema):
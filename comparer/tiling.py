@@ -0,0 +1,209 @@
+"""
+Tile-by-tile capture of tall webpages.
+
+Resizing the browser window to the full height of a very long page makes Chrome allocate one
+compositor surface for the whole page, which is slow, memory hungry and gets clipped on the
+longest pages. Here the viewport keeps a fixed size instead, the page is scrolled one tile at a
+time and every tile is appended to a PNG file as soon as it is captured, so neither the
+browser nor this process holds the whole page at once.
+"""
+import io
+import os
+import struct
+import zlib
+from typing import TYPE_CHECKING, Iterator
+
+from PIL import Image
+
+if TYPE_CHECKING:
+    from selenium import webdriver
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Elements with a fixed or sticky position would be repeated on every tile, so they are
+# hidden once the first tile has been captured and shown again after the last one
+HIDE_FIXED_SCRIPT = """
+for (const element of document.querySelectorAll('body *')) {
+    const position = getComputedStyle(element).position;
+    if (position === 'fixed' || position === 'sticky') {
+        element.dataset.tileHidden = element.style.getPropertyValue('visibility');
+        element.style.setProperty('visibility', 'hidden', 'important');
+    }
+}
+"""
+SHOW_FIXED_SCRIPT = """
+for (const element of document.querySelectorAll('[data-tile-hidden]')) {
+    element.style.setProperty('visibility', element.dataset.tileHidden);
+    delete element.dataset.tileHidden;
+}
+"""
+
+
+class StreamingPngWriter:
+    """
+    Writes an RGB PNG file strip by strip, keeping only the current strip in memory.
+
+    Rows are stored unfiltered and compressed by one zlib stream across all strips, which
+    makes the file somewhat larger than one written by Pillow but lets it grow without
+    holding the image. Used as a context manager, the file is completed when the block ends
+    and deleted if the block raises, so no partial screenshot is left behind.
+
+    Attributes:
+        path (str): The file path of the image.
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+
+    Methods:
+        write(self, strip: Image.Image): Appends a strip of rows to the image.
+        close(self): Completes the file.
+        discard(self): Closes and deletes the incomplete file.
+    """
+    def __init__(self, path: str, width: int, height: int):
+        self.path = path
+        self.width = width
+        self.height = height
+        self._rows_left = height
+        self._compressor = zlib.compressobj(6)
+        self._file = open(path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        # 8 bits per channel, truecolor, default compression, filtering and no interlace
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self) -> 'StreamingPngWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, strip: Image.Image):
+        """
+        Appends a strip of rows to the image.
+
+        The strip is converted to RGB, cut or padded to the width of the image, and cut to
+        the rows that are still missing.
+
+        Args:
+            strip (Image.Image): The rows to append.
+        """
+        rows = min(strip.height, self._rows_left)
+        if rows <= 0:
+            return
+        if strip.mode != 'RGB':
+            strip = strip.convert('RGB')
+        if strip.size != (self.width, rows):
+            strip = strip.crop((0, 0, self.width, rows))
+        raw = strip.tobytes()
+        stride = self.width * 3
+        # every row starts with its filter type, 0 is no filter
+        data = b''.join(
+            b'\x00' + raw[start:start + stride] for start in range(0, len(raw), stride)
+        )
+        self._chunk(b'IDAT', self._compressor.compress(data))
+        self._rows_left -= rows
+
+    def close(self):
+        """
+        Completes the file, filling the rows that were not written with black.
+        """
+        if self._file.closed:
+            return
+        if self._rows_left > 0:
+            self.write(Image.new('RGB', (self.width, self._rows_left)))
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self._file.close()
+
+    def discard(self):
+        """
+        Closes the file without completing it and deletes it.
+        """
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _chunk(self, kind: bytes, data: bytes):
+        if kind == b'IDAT' and not data:
+            return
+        self._file.write(struct.pack('>I', len(data)) + kind + data)
+        self._file.write(struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def capture_tiles(
+    driver: 'webdriver.Chrome',
+    width: int,
+    height: int,
+    tile_height: int,
+    scale: float = 1,
+    mobile: bool = False,
+) -> Iterator[Image.Image]:
+    """
+    Scrolls a loaded webpage one viewport at a time and captures every viewport.
+
+    The viewport is emulated with a fixed size and the given device scale factor. The last
+    tile is cut to the rows below the previous one, even if the browser could not scroll as
+    far as requested. The device emulation is left in place for the caller to replace or clear.
+
+    Args:
+        driver (webdriver.Chrome): The browser with the loaded webpage.
+        width (int): Width of the page in CSS pixels.
+        height (int): Height of the page to capture in CSS pixels.
+        tile_height (int): Height of the viewport in CSS pixels.
+        scale (float): Number of screenshot pixels per CSS pixel.
+        mobile (bool): Whether the device is emulated as a mobile one.
+
+    Yields:
+        Image.Image: The tiles from the top of the page down, together `height * scale` rows
+                     high.
+    """
+    driver.execute_cdp_cmd(
+        'Emulation.setDeviceMetricsOverride',
+        {
+            'width': width,
+            'height': tile_height,
+            'deviceScaleFactor': scale,
+            'mobile': mobile,
+        },
+    )
+    try:
+        for top in range(0, height, tile_height):
+            scrolled = driver.execute_script(
+                'window.scrollTo(0, arguments[0]); return window.scrollY;', top
+            )
+            with Image.open(io.BytesIO(driver.get_screenshot_as_png())) as shot:
+                offset = round((top - (scrolled or 0)) * scale)
+                rows = round(min(tile_height, height - top) * scale)
+                tile = shot.crop((0, offset, round(width * scale), offset + rows))
+            yield tile
+            if top == 0:
+                driver.execute_script(HIDE_FIXED_SCRIPT)
+    finally:
+        driver.execute_script(SHOW_FIXED_SCRIPT + 'window.scrollTo(0, 0);')
+
+
+def save_tiled_screenshot(
+    driver: 'webdriver.Chrome',
+    path: str,
+    width: int,
+    height: int,
+    tile_height: int,
+    scale: float = 1,
+    mobile: bool = False,
+):
+    """
+    Captures a loaded webpage tile by tile into a PNG file.
+
+    Args:
+        driver (webdriver.Chrome): The browser with the loaded webpage.
+        path (str): The file path of the screenshot.
+        width (int): Width of the page in CSS pixels.
+        height (int): Height of the page to capture in CSS pixels.
+        tile_height (int): Height of the viewport in CSS pixels.
+        scale (float): Number of screenshot pixels per CSS pixel.
+        mobile (bool): Whether the device is emulated as a mobile one.
+    """
+    with StreamingPngWriter(path, round(width * scale), round(height * scale)) as writer:
+        for tile in capture_tiles(driver, width, height, tile_height, scale, mobile):
+            writer.write(tile)
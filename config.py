@@ -14,4 +14,48 @@ mysql_username: str = data['mysql']['username']
 mysql_password: str = data['mysql']['password']
 mysql_hostname: str = data['mysql']['hostname']
 mysql_port: str = data['mysql']['port']
+mysql_executor_workers: int = data['mysql'].get('executor_workers', 5)
+mysql_write_behind: bool = data['mysql'].get('write_behind', False)
+mysql_write_behind_batch: int = data['mysql'].get('write_behind_batch', 100)
+mysql_write_behind_interval: float = data['mysql'].get('write_behind_interval', 2)
 screenshots_folder: str = data['screenshots']['folder']
+scheduler_max_workers: int = data.get('scheduler', {}).get('max_workers', 10)
+scheduler_max_instances: int = data.get('scheduler', {}).get('max_instances', 10)
+scheduler_run_in_ui: bool = data.get('scheduler', {}).get('run_in_ui', True)
+scheduler_sync_interval: float = data.get('scheduler', {}).get('sync_interval', 60)
+archive_enabled: bool = data.get('archive', {}).get('enabled', True)
+archive_after_days: float = data.get('archive', {}).get('after_days', 7)
+archive_interval_hours: float = data.get('archive', {}).get('interval_hours', 24)
+archive_keyframe_interval: int = data.get('archive', {}).get('keyframe_interval', 30)
+archive_tile_size: int = data.get('archive', {}).get('tile_size', 256)
+archive_max_delta_ratio: float = data.get('archive', {}).get('max_delta_ratio', 0.5)
+archive_keyframe_cache_mb: int = data.get('archive', {}).get('keyframe_cache_mb', 512)
+profiling_folder: str = data.get('profiling', {}).get('folder', './profiles/')
+profiling_top_functions: int = data.get('profiling', {}).get('top_functions', 30)
+profiling_top_allocations: int = data.get('profiling', {}).get('top_allocations', 20)
+profiling_traceback_frames: int = data.get('profiling', {}).get('traceback_frames', 1)
+overlays_tile_size: int = data.get('overlays', {}).get('tile_size', 32)
+overlays_max_width: int = data.get('overlays', {}).get('max_width', 800)
+overlays_max_height: int = data.get('overlays', {}).get('max_height', 4000)
+overlays_closeup_margin: int = data.get('overlays', {}).get('closeup_margin', 40)
+overlays_closeup_max_size: int = data.get('overlays', {}).get('closeup_max_size', 1280)
+overlays_quality: int = data.get('overlays', {}).get('quality', 80)
+overlays_max_aspect_ratio: float = data.get('overlays', {}).get('max_aspect_ratio', 15)
+startup_log_file: str = data.get('startup', {}).get('log_file', './startup.csv')
+capture_page_load_timeout: float = data.get('capture', {}).get('page_load_timeout', 30)
+capture_script_timeout: float = data.get('capture', {}).get('script_timeout', 10)
+capture_check_timeout: float = data.get('capture', {}).get('check_timeout', 90)
+capture_breaker_failures: int = data.get('capture', {}).get('breaker_failures', 3)
+capture_breaker_cooldown: float = data.get('capture', {}).get('breaker_cooldown', 600)
+capture_cache_freshness: float = data.get('capture', {}).get('cache_freshness', 60)
+capture_per_host_limit: int = data.get('capture', {}).get('per_host_limit', 2)
+capture_disk_cache_folder: str = data.get('capture', {}).get('disk_cache_folder', './chrome-cache/')
+capture_profiles: dict[str, dict] = data.get('capture_profiles', {'default': {}})
+capture_viewports: dict[str, dict] = data.get('capture_viewports', {})
+capture_min_free_memory_mb: float = data.get('capture', {}).get('min_free_memory_mb', 1024)
+capture_max_in_flight: int = data.get('capture', {}).get('max_in_flight', 10)
+capture_memory_estimate_mb: float = data.get('capture', {}).get('memory_estimate_mb', 500)
+capture_defer_delay: float = data.get('capture', {}).get('defer_delay', 15)
+capture_max_height: int = data.get('capture', {}).get('max_height', 20000)
+capture_tile_threshold: int = data.get('capture', {}).get('tile_threshold', 4000)
+capture_tile_height: int = data.get('capture', {}).get('tile_height', 1000)
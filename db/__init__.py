@@ -1,4 +1,4 @@
-from .engine import engine
+from .engine import create_schema, engine
 from .utils import (
     get_all_trackings,
     get_tracking_by_id,
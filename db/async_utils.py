@@ -0,0 +1,119 @@
+"""
+Asyncio variants of the `db.utils` API.
+
+The synchronous functions block on every MySQL round-trip, which inside NiceGUI's event loop
+freezes all connected clients. The functions here run them in a dedicated thread pool sized
+like the engine's connection pool and await the result, so the event loop stays free while
+the database works.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+import config
+
+from . import utils
+from .schemas import (
+    TrackingCreateSchema,
+    TrackingSchema,
+    WebPageStateCreateSchema,
+    WebPageStateSchema,
+)
+
+T = TypeVar('T')
+
+executor = ThreadPoolExecutor(
+    max_workers=config.mysql_executor_workers, thread_name_prefix='db'
+)
+
+
+async def run_in_db_executor(func: Callable[..., T], *args: Any) -> T:
+    """
+    Runs a synchronous database function in the database thread pool.
+
+    Args:
+        func (Callable[..., T]): The function to run.
+        *args (Any): Positional arguments for the function.
+
+    Returns:
+        T: The function's result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def get_all_trackings() -> list[TrackingSchema]:
+    """
+    Retrieves all tracking entries without blocking the event loop.
+
+    Returns:
+        list[TrackingSchema]: A list of TrackingSchema instances representing all trackings.
+    """
+    return await run_in_db_executor(utils.get_all_trackings)
+
+
+async def get_tracking_by_id(id: int) -> TrackingSchema | None:
+    """
+    Retrieves a tracking entry by its ID without blocking the event loop.
+
+    Args:
+        id (int): The ID of the tracking entry to retrieve.
+
+    Returns:
+        TrackingSchema | None: A TrackingSchema instance if the tracking is found, otherwise None.
+    """
+    return await run_in_db_executor(utils.get_tracking_by_id, id)
+
+
+async def create_new_tracking(tr: TrackingCreateSchema) -> TrackingSchema:
+    """
+    Creates a new tracking entry without blocking the event loop.
+
+    Args:
+        tr (TrackingCreateSchema): The schema containing the data for the new tracking.
+
+    Returns:
+        TrackingSchema: A schema instance representing the newly created tracking.
+    """
+    return await run_in_db_executor(utils.create_new_tracking, tr)
+
+
+async def create_new_trackings(
+    trs: list[TrackingCreateSchema],
+) -> list[TrackingSchema]:
+    """
+    Creates many tracking entries in batches without blocking the event loop.
+
+    Args:
+        trs (list[TrackingCreateSchema]): The schemas containing the data for the new trackings.
+
+    Returns:
+        list[TrackingSchema]: Schema instances representing the newly created trackings.
+    """
+    return await run_in_db_executor(utils.create_new_trackings, trs)
+
+
+async def create_new_website_state(
+    state: WebPageStateCreateSchema,
+) -> WebPageStateSchema:
+    """
+    Creates a new webpage state entry without blocking the event loop.
+
+    Args:
+        state (WebPageStateCreateSchema): The schema containing the data for the new state.
+
+    Returns:
+        WebPageStateSchema: A schema instance representing the newly created state.
+    """
+    return await run_in_db_executor(utils.create_new_website_state, state)
+
+
+async def delete_tracking_by_id(tr_id: int):
+    """
+    Deletes a tracking entry and its associated states without blocking the event loop.
+
+    Args:
+        tr_id (int): The ID of the tracking entry to be deleted.
+    """
+    await run_in_db_executor(utils.delete_tracking_by_id, tr_id)
@@ -0,0 +1,236 @@
+"""
+Bulk import and streaming export of trackings.
+
+Trackings are imported from CSV with a header row or from a JSON list of objects, both with
+the fields `url`, `interval`, `save_all_screenshots`, `capture_profile`, `max_height` and
+`viewports`; only `url` and `interval` are required. The interval is a number of seconds or
+`H:MM:SS`, the viewports are a list or a comma-separated string of viewport names.
+"""
+import csv
+import datetime as dt
+import io
+import json
+import math
+from typing import Any, Iterator
+
+import validators
+
+import config
+
+from .engine import session_create
+from .models import Tracking, WebPageState
+from .schemas import TrackingCreateSchema
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', '+'}
+MAX_INTERVAL = dt.timedelta(days=365)
+
+TRACKING_EXPORT_FIELDS = [
+    'id',
+    'url',
+    'interval',
+    'save_all_screenshots',
+    'capture_profile',
+    'max_height',
+    'viewports',
+    'created_at',
+]
+STATE_EXPORT_FIELDS = [
+    'id',
+    'tracking_id',
+    'viewport',
+    'created_at',
+    'image_filename',
+    'fingerprint',
+    'overlay_filename',
+    'closeup_filename',
+    'error',
+]
+
+
+def parse_interval(value: Any) -> dt.timedelta:
+    """
+    Parses a check interval given as seconds or as `H:MM:SS`.
+
+    Args:
+        value (Any): The interval from the imported file.
+
+    Returns:
+        dt.timedelta: The interval.
+
+    Raises:
+        ValueError: If the value is not a valid positive interval of at most MAX_INTERVAL.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'неправильный интервал {value!r}')
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = str(value).strip()
+        seconds = 0.0
+        for part in text.split(':'):
+            seconds = seconds * 60 + float(part)
+    if not math.isfinite(seconds) or seconds > MAX_INTERVAL.total_seconds():
+        raise ValueError(f'интервал должен быть не больше {MAX_INTERVAL.days} дней')
+    if seconds <= 0:
+        raise ValueError('интервал должен быть больше 0')
+    return dt.timedelta(seconds=seconds)
+
+
+def parse_trackings(
+    content: str, format: str
+) -> tuple[list[TrackingCreateSchema], list[str]]:
+    """
+    Parses and validates trackings from the contents of a CSV or JSON file.
+
+    Every record is validated on its own, so one bad record does not reject the others.
+
+    Args:
+        content (str): The contents of the file.
+        format (str): `csv` or `json`.
+
+    Returns:
+        tuple[list[TrackingCreateSchema], list[str]]: The valid trackings and one error message
+                                                     per invalid record.
+    """
+    if format == 'json':
+        try:
+            records = json.loads(content)
+        except json.JSONDecodeError as exc:
+            return [], [f'Неправильный JSON: {exc}']
+        if not isinstance(records, list):
+            return [], ['JSON должен содержать список отслеживаний']
+        first_record = 1
+    else:
+        records = list(csv.DictReader(io.StringIO(content)))
+        # the header is line 1
+        first_record = 2
+    trackings, errors = [], []
+    for number, record in enumerate(records, start=first_record):
+        try:
+            trackings.append(_parse_record(record))
+        except (ValueError, TypeError, AttributeError, OverflowError) as exc:
+            errors.append(f'Запись {number}: {exc}')
+    return trackings, errors
+
+
+def _parse_record(record: dict[str, Any]) -> TrackingCreateSchema:
+    url = str(record.get('url') or '').strip()
+    if validators.url(url) is not True:
+        raise ValueError(f'неправильная ссылка {url!r}')
+    if record.get('interval') in (None, ''):
+        raise ValueError('не указан интервал')
+    save_all_screenshots = record.get('save_all_screenshots') or False
+    if not isinstance(save_all_screenshots, bool):
+        save_all_screenshots = str(save_all_screenshots).strip().lower() in TRUE_VALUES
+    capture_profile = str(record.get('capture_profile') or 'default').strip()
+    if capture_profile not in config.capture_profiles:
+        raise ValueError(f'неизвестный профиль снимка {capture_profile!r}')
+    max_height = record.get('max_height')
+    if max_height in (None, ''):
+        max_height = None
+    elif int(max_height) <= 0:
+        raise ValueError('максимальная высота должна быть больше 0')
+    viewports = record.get('viewports') or []
+    if isinstance(viewports, str):
+        viewports = viewports.split(',')
+    # a repeated name would capture the same file twice
+    viewports = list(
+        dict.fromkeys(str(name).strip() for name in viewports if str(name).strip())
+    )
+    for name in viewports:
+        if name not in config.capture_viewports:
+            raise ValueError(f'неизвестное устройство {name!r}')
+    return TrackingCreateSchema(
+        url=url,
+        interval=parse_interval(record['interval']),
+        save_all_screenshots=save_all_screenshots,
+        capture_profile=capture_profile,
+        max_height=int(max_height) if max_height else None,
+        viewports=viewports,
+    )
+
+
+def _csv_lines(
+    fields: list[str], rows: Iterator[dict[str, Any]]
+) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        # there were no rows, only the header is left
+        yield buffer.getvalue()
+
+
+def _paged(model: type[Tracking | WebPageState], batch_size: int) -> Iterator[Any]:
+    # pages through a table by primary key; the MySQL driver buffers whole result sets,
+    # so one query over the table would load all of it into memory at once
+    last_id = 0
+    while True:
+        with session_create() as session:
+            page = (
+                session.query(model)
+                .filter(model.id > last_id)
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+        yield from page
+        if len(page) < batch_size:
+            return
+        last_id = page[-1].id
+
+
+def export_trackings_csv(batch_size: int = 1000) -> Iterator[str]:
+    """
+    Streams all trackings as CSV, reading them from the database in batches.
+
+    Args:
+        batch_size (int): Number of trackings fetched per round-trip.
+
+    Yields:
+        str: The header and then one CSV line per tracking.
+    """
+    trackings = _paged(Tracking, batch_size)
+    yield from _csv_lines(
+        TRACKING_EXPORT_FIELDS,
+        (
+            {
+                'id': tr.id,
+                'url': tr.url,
+                'interval': int(tr.interval.total_seconds()),
+                'save_all_screenshots': tr.save_all_screenshots,
+                'capture_profile': tr.capture_profile,
+                'max_height': tr.max_height,
+                'viewports': tr.viewports,
+                'created_at': tr.created_at,
+            }
+            for tr in trackings
+        ),
+    )
+
+
+def export_states_csv(batch_size: int = 1000) -> Iterator[str]:
+    """
+    Streams the metadata of all webpage states as CSV, reading them in batches.
+
+    States are listed in the order they were saved.
+
+    Args:
+        batch_size (int): Number of states fetched per round-trip.
+
+    Yields:
+        str: The header and then one CSV line per state.
+    """
+    states = _paged(WebPageState, batch_size)
+    yield from _csv_lines(
+        STATE_EXPORT_FIELDS,
+        (
+            {field: getattr(state, field) for field in STATE_EXPORT_FIELDS}
+            for state in states
+        ),
+    )
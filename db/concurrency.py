@@ -0,0 +1,130 @@
+"""
+Concurrency test of the database access from NiceGUI handlers.
+
+Simulates many UI clients that refresh the trackings list the way the main page does, once
+through the synchronous `db.utils` API called straight from the event loop and once through
+`db.async_utils`, and measures how long the event loop is stalled. A stalled event loop is
+what every connected client experiences as a frozen page.
+
+Usage:
+    python -m db.concurrency --clients 200 --duration 15 --period 3
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from pydantic import BaseModel
+
+from . import async_utils, utils
+
+
+class ConcurrencyReport(BaseModel):
+    """
+    Result of one concurrency test run. All durations are in milliseconds.
+
+    Attributes:
+        mode (str): `sync` or `async`, the database API the clients used.
+        clients (int): Number of simulated clients.
+        requests (int): Number of completed trackings list requests.
+        requests_per_second (float): Request throughput.
+        request_p95 (float): 95th percentile of the request latency seen by a client.
+        loop_lag_p50 (float): Median delay of the event loop heartbeat.
+        loop_lag_p95 (float): 95th percentile of the event loop heartbeat delay.
+        loop_lag_max (float): Longest event loop stall.
+    """
+    mode: str
+    clients: int
+    requests: int
+    requests_per_second: float
+    request_p95: float
+    loop_lag_p50: float
+    loop_lag_p95: float
+    loop_lag_max: float
+
+    def __str__(self) -> str:
+        return '\n'.join(f'{name}: {value}' for name, value in self)
+
+
+async def _heartbeat(deadline: float, lags: list[float], tick: float = 0.01):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        await asyncio.sleep(tick)
+        lags.append((time.monotonic() - started - tick) * 1000)
+
+
+async def _client(
+    mode: str, deadline: float, period: float, latencies: list[float]
+):
+    await asyncio.sleep(random.uniform(0, period))
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        if mode == 'sync':
+            utils.get_all_trackings()
+        else:
+            await async_utils.get_all_trackings()
+        latencies.append((time.monotonic() - started) * 1000)
+        await asyncio.sleep(period)
+
+
+async def measure(
+    mode: str, clients: int, duration: float, period: float
+) -> ConcurrencyReport:
+    """
+    Runs simulated clients against the database for `duration` seconds.
+
+    Args:
+        mode (str): `sync` to call `db.utils` from the event loop, `async` to use `db.async_utils`.
+        clients (int): Number of simulated clients.
+        duration (float): Length of the run in seconds.
+        period (float): Seconds between two refreshes of one client.
+
+    Returns:
+        ConcurrencyReport: The measured throughput and event loop stalls.
+    """
+    deadline = time.monotonic() + duration
+    lags: list[float] = []
+    latencies: list[float] = []
+    await asyncio.gather(
+        _heartbeat(deadline, lags),
+        *[_client(mode, deadline, period, latencies) for _ in range(clients)],
+    )
+    lags.sort()
+    latencies.sort()
+    return ConcurrencyReport(
+        mode=mode,
+        clients=clients,
+        requests=len(latencies),
+        requests_per_second=len(latencies) / duration,
+        request_p95=_percentile(latencies, 0.95),
+        loop_lag_p50=_percentile(lags, 0.5),
+        loop_lag_p95=_percentile(lags, 0.95),
+        loop_lag_max=lags[-1] if lags else 0.0,
+    )
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure event loop stalls caused by database calls from UI handlers.'
+    )
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=15, help='seconds per mode')
+    parser.add_argument(
+        '--period', type=float, default=3, help='seconds between refreshes of a client'
+    )
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    args = parser.parse_args()
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        print(asyncio.run(measure(mode, args.clients, args.duration, args.period)))
+        print()
+
+
+if __name__ == '__main__':
+    main()
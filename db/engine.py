@@ -5,9 +5,18 @@ from .models import Base
 import config
 
 connection_string = f'mysql+mysqlconnector://{config.mysql_username}:{config.mysql_password}@{config.mysql_hostname}/{config.mysql_name}'
+# the engine connects on first use, importing this module does not touch the database
 engine = create_engine(connection_string)
 
-Base.metadata.create_all(engine)
+
+def create_schema():
+    """
+    Creates the tables that do not exist yet.
+
+    Called once by every entry point at startup rather than on import, so that importing the
+    `db` package stays free of database round-trips.
+    """
+    Base.metadata.create_all(engine)
 
 
 def session_create() -> Session:
@@ -17,6 +17,9 @@ class Tracking(Base):
         url (Mapped[str]): URL of the webpage to be tracked.
         interval (Mapped[dt.timedelta]): Interval at which the webpage should be checked for changes.
         save_all_screenshots (Mapped[bool]): Flag indicating whether to save screenshots for all checks or only when changes are detected.
+        capture_profile (Mapped[str]): Name of the capture profile from the settings the webpage is captured with.
+        max_height (Mapped[int | None]): Height in pixels the screenshot is cut at, or None to use the global cap.
+        viewports (Mapped[str]): Comma-separated names of the viewports from the settings the webpage is captured in, empty for one capture at the page's own width.
         created_at (Mapped[dt.datetime]): Timestamp when the tracking entry was created, automatically set to the current time.
         web_page_states (Mapped[list['WebPageState']]): Relationship to associated WebPageState objects, representing different states of the tracked webpage.
 
@@ -29,6 +32,13 @@ class Tracking(Base):
     url: Mapped[str] = mapped_column(String(255))
     interval: Mapped[dt.timedelta] = mapped_column(Interval)
     save_all_screenshots: Mapped[bool]
+    capture_profile: Mapped[str] = mapped_column(
+        String(50), default='default', server_default='default'
+    )
+    max_height: Mapped[int | None]
+    viewports: Mapped[str] = mapped_column(
+        String(255), default='', server_default=''
+    )
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -51,7 +61,12 @@ class WebPageState(Base):
         id (Mapped[int]): Primary key, unique identifier for the webpage state.
         tracking_id (Mapped[int]): Foreign key, references the id of the associated Tracking object.
         tracking (Mapped[Tracking]): Relationship to the associated Tracking object.
-        image_filename (Mapped[str]): Filename of the screenshot representing this state.
+        viewport (Mapped[str | None]): Name of the viewport the screenshot was taken in, or None for the page's own width.
+        image_filename (Mapped[str | None]): Filename of the screenshot representing this state, or None if the capture failed.
+        error (Mapped[str | None]): Description of the capture failure, or None if the capture succeeded.
+        fingerprint (Mapped[str | None]): SHA-256 of the screenshot file, equal for identical screenshots.
+        overlay_filename (Mapped[str | None]): Filename of the downscaled screenshot with the last change highlighted, or None if no change was detected.
+        closeup_filename (Mapped[str | None]): Filename of the close-up of the largest region of the last change, or None if no change was detected.
         created_at (Mapped[dt.datetime]): Timestamp when the webpage state was recorded, automatically set to the current time.
 
     Methods:
@@ -64,13 +79,18 @@ class WebPageState(Base):
         ForeignKey('trackings.id', ondelete='CASCADE')
     )
     tracking: Mapped[Tracking] = relationship(back_populates='web_page_states')
-    image_filename: Mapped[str] = mapped_column(String(100))
+    viewport: Mapped[str | None] = mapped_column(String(50))
+    image_filename: Mapped[str | None] = mapped_column(String(100))
+    error: Mapped[str | None] = mapped_column(String(255))
+    fingerprint: Mapped[str | None] = mapped_column(String(64))
+    overlay_filename: Mapped[str | None] = mapped_column(String(150))
+    closeup_filename: Mapped[str | None] = mapped_column(String(150))
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
 
     def __repr__(self) -> str:
-        return f'WebPageState(id={self.id!r}, tracking={self.tracking!r}, image_filename={self.image_filename!r}, time={self.created_at!r})'
+        return f'WebPageState(id={self.id!r}, tracking={self.tracking!r}, image_filename={self.image_filename!r}, error={self.error!r}, time={self.created_at!r})'
 
     def __str__(self) -> str:
         return f'{self.tracking!s} at {self.created_at!s}'
@@ -9,10 +9,24 @@ class WebPageStateCreateSchema(BaseModel):
 
     Attributes:
         tracking_id (int): The ID of the tracking entry associated with this state.
-        image_filename (str): The filename of the screenshot representing this state.
+        viewport (str | None): The name of the viewport the screenshot was taken in, or None
+                               for the page's own width.
+        image_filename (str | None): The filename of the screenshot representing this state,
+                                     or None if the capture failed.
+        error (str | None): Description of the capture failure, or None if the capture succeeded.
+        fingerprint (str | None): SHA-256 of the screenshot file, equal for identical screenshots.
+        overlay_filename (str | None): The filename of the downscaled screenshot with the last
+                                       change highlighted, or None if no change was detected.
+        closeup_filename (str | None): The filename of the close-up of the largest region of
+                                       the last change, or None if no change was detected.
     """
     tracking_id: int
-    image_filename: str
+    viewport: str | None = None
+    image_filename: str | None = None
+    error: str | None = None
+    fingerprint: str | None = None
+    overlay_filename: str | None = None
+    closeup_filename: str | None = None
 
 
 class WebPageStateSchema(WebPageStateCreateSchema):
@@ -23,10 +37,11 @@ class WebPageStateSchema(WebPageStateCreateSchema):
         WebPageStateCreateSchema: The base schema for creating a webpage state.
 
     Attributes:
-        id (int): The unique identifier for this webpage state.
+        id (int | None): The unique identifier for this webpage state, or None while the state
+                         waits in the write-behind buffer.
         created_at (dt.datetime): The timestamp when this state was created.
     """
-    id: int
+    id: int | None
     created_at: dt.datetime
 
 
@@ -38,11 +53,17 @@ class TrackingCreateSchema(BaseModel):
         url (str): The URL of the webpage to track.
         interval (dt.timedelta): The interval at which to check the webpage for changes.
         save_all_screenshots (bool): Whether to save screenshots for all checks or only when changes are detected.
+        capture_profile (str): The name of the capture profile the webpage is captured with.
+        max_height (int | None): Height in pixels the screenshot is cut at, or None to use the global cap.
+        viewports (list[str]): The names of the viewports the webpage is captured in, empty for one capture at the page's own width.
     """
 
     url: str
     interval: dt.timedelta
     save_all_screenshots: bool
+    capture_profile: str = 'default'
+    max_height: int | None = None
+    viewports: list[str] = []
 
 
 class TrackingSchema(BaseModel):
@@ -58,11 +79,19 @@ class TrackingSchema(BaseModel):
         interval (dt.timedelta): The interval at which the webpage is checked for changes.
         created_at (dt.datetime): The timestamp when this tracking entry was created.
         save_all_screenshots (bool): Whether to save screenshots for all checks or only when changes are detected.
-        last_state (WebPageStateSchema | None): The last recorded state of the webpage, or None if no states have been recorded.
+        capture_profile (str): The name of the capture profile the webpage is captured with.
+        max_height (int | None): Height in pixels the screenshot is cut at, or None to use the global cap.
+        viewports (list[str]): The names of the viewports the webpage is captured in, empty for one capture at the page's own width.
+        last_state (WebPageStateSchema | None): The last successfully captured state of the webpage in its first viewport, or None if no states have been captured.
+        last_states (list[WebPageStateSchema]): The last successfully captured state of every viewport that has one.
     """
     id: int
     url: str
     interval: dt.timedelta
     created_at: dt.datetime
     save_all_screenshots: bool
+    capture_profile: str = 'default'
+    max_height: int | None = None
+    viewports: list[str] = []
     last_state: WebPageStateSchema | None
+    last_states: list[WebPageStateSchema] = []
@@ -1,55 +1,131 @@
+import atexit
+import datetime as dt
+
+from sqlalchemy import and_, func, select
+
+import config
+
 from .engine import session_create
 from .models import *
 from .schemas import *
+from .write_behind import StateWriteBuffer
+
+state_buffer = (
+    StateWriteBuffer(
+        config.mysql_write_behind_batch, config.mysql_write_behind_interval
+    )
+    if config.mysql_write_behind
+    else None
+)
+if state_buffer:
+    atexit.register(state_buffer.close)
+
+
+def state_model_to_schema(state: WebPageState) -> WebPageStateSchema:
+    """
+    Converts a WebPageState model instance to a WebPageStateSchema.
+
+    Args:
+        state (WebPageState): A WebPageState model instance to be converted.
 
+    Returns:
+        WebPageStateSchema: A schema instance representing the state.
+    """
+    return WebPageStateSchema(
+        id=state.id,
+        tracking_id=state.tracking_id,
+        viewport=state.viewport,
+        image_filename=state.image_filename,
+        error=state.error,
+        fingerprint=state.fingerprint,
+        overlay_filename=state.overlay_filename,
+        closeup_filename=state.closeup_filename,
+        created_at=state.created_at,
+    )
 
-def tracking_model_to_schema(tr: Tracking) -> TrackingSchema:
+
+def tracking_model_to_schema(
+    tr: Tracking, db_last_states: list[WebPageState] | None = None
+) -> TrackingSchema:
     """
     Converts a Tracking model instance to a TrackingSchema.
 
-    This function takes a Tracking model instance, retrieves its last state, and constructs
+    This function takes a Tracking model instance, retrieves its last states, and constructs
     a TrackingSchema instance with all the relevant fields from the Tracking model and its
-    last state.
+    last states. A state still waiting in the write-behind buffer counts as the last state of
+    its viewport.
 
     Args:
         tr (Tracking): A Tracking model instance to be converted.
+        db_last_states (list[WebPageState] | None): The last states of the tracking, if they
+            were already loaded by the caller, to avoid one query per tracking.
 
     Returns:
-        TrackingSchema: A schema instance representing the tracking and its last state.
+        TrackingSchema: A schema instance representing the tracking and its last states.
     """
-    last_state = get_last_state(tr)
+    if db_last_states is None:
+        db_last_states = get_last_states(tr.id).get(tr.id, [])
+    last_states = {
+        state.viewport: state_model_to_schema(state) for state in db_last_states
+    }
+    if state_buffer:
+        for state in state_buffer.last_states(tr.id):
+            last_states[state.viewport] = state
+    viewports = split_viewports(tr.viewports)
+    ordered_states = [
+        last_states[viewport]
+        for viewport in viewports or [None]
+        if viewport in last_states
+    ]
     return TrackingSchema(
         id=tr.id,
         url=tr.url,
         interval=tr.interval,
         created_at=tr.created_at,
         save_all_screenshots=tr.save_all_screenshots,
-        last_state=(
-            WebPageStateSchema(
-                id=last_state.id,
-                tracking_id=last_state.tracking_id,
-                image_filename=last_state.image_filename,
-                created_at=last_state.created_at,
-            )
-            if last_state
-            else None
-        ),
+        capture_profile=tr.capture_profile,
+        max_height=tr.max_height,
+        viewports=viewports,
+        last_state=ordered_states[0] if ordered_states else None,
+        last_states=ordered_states,
     )
 
 
+def split_viewports(viewports: str | None) -> list[str]:
+    """
+    Splits the viewports column of a tracking into viewport names.
+
+    Every viewport is captured into a file named after it, so repeated names are dropped.
+
+    Args:
+        viewports (str | None): Comma-separated viewport names.
+
+    Returns:
+        list[str]: The distinct viewport names in their original order, empty for a capture
+                   at the page's own width.
+    """
+    names = (name.strip() for name in (viewports or '').split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
 def get_all_trackings() -> list[TrackingSchema]:
     """
     Retrieves all tracking entries from the database and converts them to TrackingSchema.
 
-    This function queries the database for all Tracking model instances, converts each to
-    a TrackingSchema using `tracking_model_to_schema`, and returns a list of these schemas.
+    This function queries the database for all Tracking model instances and the last states
+    of all of them in two queries, converts each to a TrackingSchema using
+    `tracking_model_to_schema`, and returns a list of these schemas.
 
     Returns:
         list[TrackingSchema]: A list of TrackingSchema instances representing all trackings.
     """
     with session_create() as session:
         trackings = session.query(Tracking).all()
-        return [tracking_model_to_schema(tracking) for tracking in trackings]
+        last_states = get_last_states()
+        return [
+            tracking_model_to_schema(tracking, last_states.get(tracking.id, []))
+            for tracking in trackings
+        ]
 
 
 def get_tracking_by_id(id: int) -> TrackingSchema | None:
@@ -76,65 +152,146 @@ def create_new_tracking(tr: TrackingCreateSchema) -> TrackingSchema:
             url=tr.url,
             interval=tr.interval,
             save_all_screenshots=tr.save_all_screenshots,
+            capture_profile=tr.capture_profile,
+            max_height=tr.max_height,
+            viewports=','.join(dict.fromkeys(tr.viewports)),
         )
         session.add(db_tracking)
         session.commit()
         return tracking_model_to_schema(db_tracking)
 
 
+def create_new_trackings(
+    trs: list[TrackingCreateSchema], batch_size: int = 500
+) -> list[TrackingSchema]:
+    """
+    Creates many tracking entries in the database, committing them in batches.
+
+    Each batch of `batch_size` trackings is inserted in one transaction. The creation time is
+    set by the application, so no tracking has to be read back after the insert, and new
+    trackings have no last state to look up.
+
+    Args:
+        trs (list[TrackingCreateSchema]): The schemas containing the data for the new trackings.
+        batch_size (int): Number of trackings inserted per transaction.
+
+    Returns:
+        list[TrackingSchema]: Schema instances representing the newly created trackings.
+    """
+    created = []
+    with session_create() as session:
+        for start in range(0, len(trs), batch_size):
+            created_at = dt.datetime.now()
+            db_trackings = [
+                Tracking(
+                    url=tr.url,
+                    interval=tr.interval,
+                    save_all_screenshots=tr.save_all_screenshots,
+                    capture_profile=tr.capture_profile,
+                    max_height=tr.max_height,
+                    viewports=','.join(dict.fromkeys(tr.viewports)),
+                    created_at=created_at,
+                )
+                for tr in trs[start:start + batch_size]
+            ]
+            session.add_all(db_trackings)
+            session.commit()
+            created.extend(
+                TrackingSchema(
+                    id=db_tracking.id,
+                    url=db_tracking.url,
+                    interval=db_tracking.interval,
+                    created_at=created_at,
+                    save_all_screenshots=db_tracking.save_all_screenshots,
+                    capture_profile=db_tracking.capture_profile,
+                    max_height=db_tracking.max_height,
+                    viewports=split_viewports(db_tracking.viewports),
+                    last_state=None,
+                )
+                for db_tracking in db_trackings
+            )
+    return created
+
+
 def create_new_website_state(
     state: WebPageStateCreateSchema,
 ) -> WebPageStateSchema:
     """
-    Creates a new tracking entry in the database from a TrackingCreateSchema.
+    Creates a new webpage state entry in the database from a WebPageStateCreateSchema.
 
-    This function takes a TrackingCreateSchema instance, creates a new Tracking model instance
-    with the provided data, saves it to the database, and returns a TrackingSchema representation
-    of the newly created tracking.
+    The state refers to its tracking by `tracking_id` only, without loading the tracking. If
+    the write-behind buffer is enabled, the state is queued and inserted later together with
+    other states; it is visible to `get_tracking_by_id` right away.
 
     Args:
-        tr (TrackingCreateSchema): The schema containing the data for the new tracking.
+        state (WebPageStateCreateSchema): The schema containing the data for the new state.
 
     Returns:
-        TrackingSchema: A schema instance representing the newly created tracking.
+        WebPageStateSchema: A schema instance representing the newly created state.
     """
+    if state_buffer:
+        return state_buffer.add(state)
     with session_create() as session:
-        tracking = session.query(Tracking).get(state.tracking_id)
         db_state = WebPageState(
-            tracking=tracking,
+            tracking_id=state.tracking_id,
+            viewport=state.viewport,
             image_filename=state.image_filename,
+            error=state.error,
+            fingerprint=state.fingerprint,
+            overlay_filename=state.overlay_filename,
+            closeup_filename=state.closeup_filename,
         )
         session.add(db_state)
         session.commit()
-        return WebPageStateSchema(
-            id=db_state.id,
-            tracking_id=db_state.tracking_id,
-            image_filename=db_state.image_filename,
-            created_at=db_state.created_at,
-        )
+        return state_model_to_schema(db_state)
 
 
-def get_last_state(tr: Tracking) -> WebPageState | None:
+def get_last_states(tracking_id: int | None = None) -> dict[int, list[WebPageState]]:
     """
-    Retrieves the most recent state of a given tracking entry.
+    Retrieves the most recent successfully captured state of every viewport of the tracking
+    entries at once.
 
-    This function queries the database for the latest WebPageState associated with the specified
-    Tracking object. It returns the most recent state based on the `created_at` timestamp. If no
-    states are found for the given tracking, it returns None.
+    States recording failed captures are skipped, so the results can always be compared with
+    a new screenshot.
 
     Args:
-        tr (Tracking): The tracking object for which to retrieve the last state.
+        tracking_id (int | None): The ID of the only tracking to look up, or None for all
+            trackings.
 
     Returns:
-        WebPageState | None: The most recent WebPageState object if available, otherwise None.
+        dict[int, list[WebPageState]]: The last states of every tracking that has any, by
+                                       tracking ID.
     """
+    latest = (
+        select(
+            WebPageState.tracking_id,
+            WebPageState.viewport,
+            func.max(WebPageState.created_at).label('created_at'),
+        )
+        .where(WebPageState.image_filename.is_not(None))
+        .group_by(WebPageState.tracking_id, WebPageState.viewport)
+    )
+    if tracking_id is not None:
+        latest = latest.where(WebPageState.tracking_id == tracking_id)
+    latest = latest.subquery()
     with session_create() as session:
-        return (
+        states = (
             session.query(WebPageState)
-            .filter(WebPageState.tracking_id == tr.id)
-            .order_by(WebPageState.created_at.desc())
-            .first()
+            .join(
+                latest,
+                and_(
+                    WebPageState.tracking_id == latest.c.tracking_id,
+                    WebPageState.viewport.is_not_distinct_from(latest.c.viewport),
+                    WebPageState.created_at == latest.c.created_at,
+                ),
+            )
+            .filter(WebPageState.image_filename.is_not(None))
+            .all()
         )
+    last_states = {}
+    for state in states:
+        last_states.setdefault(state.tracking_id, []).append(state)
+    return last_states
 
 
 def delete_tracking_by_id(tr_id: int):
@@ -0,0 +1,165 @@
+import datetime as dt
+import logging
+import threading
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+
+from .engine import session_create
+from .models import WebPageState
+from .schemas import WebPageStateCreateSchema, WebPageStateSchema
+
+logger = logging.getLogger(__name__)
+
+
+class StateWriteBuffer:
+    """
+    Write-behind buffer grouping webpage state inserts into multi-row transactions.
+
+    States are queued in memory and written by a background thread in one multi-row INSERT
+    per batch: as soon as `max_batch` states are queued, every `flush_interval` seconds, and
+    on `close`. Until its batch is committed, the latest queued state
+    of every viewport of a tracking is served by `last_states`, so readers never miss a state
+    that was already reported as saved.
+
+    Attributes:
+        max_batch (int): Number of queued states that triggers a flush.
+        flush_interval (float): Number of seconds between two periodic flushes.
+
+    Methods:
+        add(self, state) -> WebPageStateSchema: Queues a state.
+        last_states(self, tracking_id) -> list[WebPageStateSchema]: Latest queued captures.
+        flush(self): Writes all queued states.
+        close(self): Writes all queued states and stops the background thread.
+    """
+    def __init__(self, max_batch: int, flush_interval: float):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._queue: list[WebPageStateSchema] = []
+        self._latest: dict[int, dict[str | None, WebPageStateSchema]] = {}
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name='state-write-behind', daemon=True
+        )
+        self._thread.start()
+
+    def add(self, state: WebPageStateCreateSchema) -> WebPageStateSchema:
+        """
+        Queues a webpage state for insertion.
+
+        Args:
+            state (WebPageStateCreateSchema): The state to save.
+
+        Returns:
+            WebPageStateSchema: The queued state. Its `id` is None until it is written, its
+                                `created_at` is the time it was queued. The written row gets
+                                its `created_at` from the database, like unbuffered states.
+        """
+        queued = WebPageStateSchema(
+            **state.model_dump(), id=None, created_at=dt.datetime.now()
+        )
+        with self._condition:
+            self._queue.append(queued)
+            if queued.image_filename:
+                self._latest.setdefault(queued.tracking_id, {})[queued.viewport] = queued
+            if len(self._queue) >= self.max_batch:
+                self._condition.notify()
+        return queued
+
+    def last_states(self, tracking_id: int) -> list[WebPageStateSchema]:
+        """
+        Returns the latest successfully captured state of every viewport of a tracking that
+        is not written yet.
+
+        Args:
+            tracking_id (int): The ID of the tracking entry.
+
+        Returns:
+            list[WebPageStateSchema]: The queued states, empty if the tracking has none.
+        """
+        with self._condition:
+            return list(self._latest.get(tracking_id, {}).values())
+
+    def flush(self):
+        """
+        Writes all queued states, each batch in one transaction.
+
+        If a batch is rejected, its states are written one by one, and states that still
+        cannot be stored, e.g. those of trackings deleted in the meantime, are dropped. Only
+        states left unwritten because the database cannot be reached stay queued for the next
+        flush.
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            unwritten = self._write(batch)
+            if unwritten:
+                with self._condition:
+                    self._queue[:0] = unwritten
+            unwritten_ids = {id(state) for state in unwritten}
+            with self._condition:
+                for state in batch:
+                    if id(state) in unwritten_ids:
+                        continue
+                    latest = self._latest.get(state.tracking_id, {})
+                    if latest.get(state.viewport) is state:
+                        del latest[state.viewport]
+                        if not latest:
+                            del self._latest[state.tracking_id]
+
+    def _write(self, batch: list[WebPageStateSchema]) -> list[WebPageStateSchema]:
+        # returns the states left unwritten because the database could not be reached
+        try:
+            self._insert(batch)
+            return []
+        except OperationalError:
+            logger.exception('Could not write %d webpage states', len(batch))
+            return batch
+        except SQLAlchemyError:
+            pass
+        for i, state in enumerate(batch):
+            try:
+                self._insert([state])
+            except OperationalError:
+                logger.exception('Could not write %d webpage states', len(batch) - i)
+                return batch[i:]
+            except IntegrityError:
+                # the tracking was deleted while its state was queued
+                pass
+            except SQLAlchemyError:
+                logger.exception(
+                    'Dropped a webpage state of tracking %d', state.tracking_id
+                )
+        return []
+
+    def _insert(self, states: list[WebPageStateSchema]):
+        # created_at is left to the server default, so that buffered and unbuffered states
+        # are ordered by the same clock
+        rows = [state.model_dump(exclude={'id', 'created_at'}) for state in states]
+        with session_create() as session:
+            session.execute(insert(WebPageState), rows)
+            session.commit()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """
+        Writes all queued states and stops the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
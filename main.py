@@ -1,26 +1,46 @@
+import asyncio
 import datetime as dt
+import io
 import json
+import os
 import pathlib
 
 import validators
-from nicegui import Client, app, ui
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from nicegui import Client, app, events, ui
 from nicegui.page import page
 from sqlalchemy.exc import ProgrammingError, DatabaseError
 
 import config
-from notifications.tgbot import check_id, get_link
+from startup import record_startup
 
 try:
     from comparer.scheduler import MyScheduler
+    from comparer.profiling import profiler
+    from comparer.states import admission
+    from db.engine import create_schema
     from db.schemas import TrackingCreateSchema
-    from db.utils import (
+    from db.bulk import export_states_csv, export_trackings_csv, parse_trackings
+    from db.utils import get_all_trackings
+    from db.async_utils import (
         create_new_tracking,
+        create_new_trackings,
         delete_tracking_by_id,
-        get_all_trackings,
+        get_all_trackings as get_all_trackings_async,
     )
-    scheduler = MyScheduler()
-    for tr in get_all_trackings():
-        scheduler.add_tracking(tr)
+    create_schema()
+    if config.scheduler_run_in_ui:
+        scheduler = MyScheduler()
+        scheduler.add_trackings(get_all_trackings())
+        if config.archive_enabled:
+            scheduler.add_periodic(
+                'comparer.archive:archive_old_states',
+                config.archive_interval_hours * 60 * 60,
+                'archive',
+            )
+    else:
+        # checks run in `python cli.py daemon`, which picks up changes on its next sync
+        scheduler = None
 except ProgrammingError:
     pass
 except DatabaseError:
@@ -54,19 +74,70 @@ async def exception_handler_500(request, exc):
     return client.build_response(request, 500)
 
 
+@app.get('/export/trackings.csv')
+def export_trackings():
+    """Stream all trackings as a CSV file."""
+    return StreamingResponse(
+        export_trackings_csv(),
+        media_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=trackings.csv'},
+    )
+
+
+@app.get('/export/states.csv')
+def export_states():
+    """Stream the metadata of all webpage states as a CSV file."""
+    return StreamingResponse(
+        export_states_csv(),
+        media_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=states.csv'},
+    )
+
+
+@app.get('/screenshot/{folder}/{name}')
+def get_screenshot(folder: str, name: str):
+    """Serve a screenshot, rebuilding it from the archive if it was archived."""
+    from comparer.archive import load_screenshot
+
+    if {folder, name} & {'.', '..'} or '/' in folder + name or '\\' in folder + name:
+        return Response(status_code=404)
+    path = os.path.join(config.screenshots_folder, folder, name)
+    if os.path.exists(path):
+        return FileResponse(path)
+    try:
+        image = load_screenshot(path)
+    except FileNotFoundError:
+        return Response(status_code=404)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return Response(buffer.getvalue(), media_type='image/png')
+
+
+@app.get('/profiles/files/{name}')
+def download_profile(name: str):
+    """Download a profile written by a profiled check."""
+    if name not in {file.name for file in profiler.list_files()}:
+        return Response(status_code=404)
+    return FileResponse(os.path.join(profiler.folder, name), filename=name)
+
+
 @ui.page('/')
-def index():
+async def index():
     """Define the main page of the application.
 
     This function sets up the main page of the application. It includes functionality for adding
     new tracking entries, displaying a list of all tracking entries, and deleting tracking entries.
     It also sets up the UI elements for the main page, including input fields for new trackings,
     a table to display existing trackings, and buttons for interaction.
+
+    All database calls are awaited through `db.async_utils`, so a slow query does not block
+    the other connected clients.
     """
-    def delete_tracking(event):
+    async def delete_tracking(event):
         tr_id = event.args
-        scheduler.remove_tracking_by_id(tr_id)
-        delete_tracking_by_id(tr_id)
+        if scheduler:
+            scheduler.remove_tracking_by_id(tr_id)
+        await delete_tracking_by_id(tr_id)
         trackings_list_ui.refresh()
 
     @ui.refreshable
@@ -104,12 +175,35 @@ def index():
         save_all_screenshots_input = ui.checkbox(
             'Сохранять все скриншоты', value=False
         )
+        capture_profile_input = ui.select(
+            list(config.capture_profiles),
+            label='Профиль снимка',
+            value='default',
+        ).style('width: 50%')
+        viewports_input = ui.select(
+            list(config.capture_viewports),
+            label='Устройства (по умолчанию вся ширина страницы)',
+            multiple=True,
+            value=[],
+        ).props('use-chips').style('width: 50%')
+        max_height_input = ui.number(
+            'Максимальная высота снимка, px',
+            placeholder=str(config.capture_max_height),
+            validation={
+                'Высота должна быть > 0': lambda x: x is None or x == '' or x > 0,
+            },
+        ).style('width: 50%')
 
-        def add_new_tracking():
+        async def add_new_tracking():
             if not all(
                 [
                     field.validate()
-                    for field in [minutes_input, seconds_input, url_input]
+                    for field in [
+                        minutes_input,
+                        seconds_input,
+                        url_input,
+                        max_height_input,
+                    ]
                 ]
             ):
                 ui.notification(
@@ -125,7 +219,7 @@ def index():
                     color='negative',
                 )
                 return
-            tr = create_new_tracking(
+            tr = await create_new_tracking(
                 TrackingCreateSchema(
                     url=url_input.value,
                     interval=dt.timedelta(
@@ -133,6 +227,11 @@ def index():
                         seconds=int(seconds_input.value),
                     ),
                     save_all_screenshots=save_all_screenshots_input.value,
+                    capture_profile=capture_profile_input.value,
+                    max_height=(
+                        int(max_height_input.value) if max_height_input.value else None
+                    ),
+                    viewports=viewports_input.value or [],
                 )
             )
             # add new tracking
@@ -140,7 +239,8 @@ def index():
             # clear fields
             create_new_tracking_ui.refresh()
 
-            scheduler.add_tracking(tr)
+            if scheduler:
+                scheduler.add_tracking(tr)
 
         ui.button(
             'Добавить',
@@ -148,8 +248,8 @@ def index():
         )
 
     @ui.refreshable
-    def trackings_list_ui():
-        trackings = get_all_trackings()
+    async def trackings_list_ui():
+        trackings = await get_all_trackings_async()
         table = ui.table(
             columns=[
                 {
@@ -164,18 +264,38 @@ def index():
                     'field': 'interval',
                     'required': True,
                 },
+                {
+                    'name': 'capture_profile',
+                    'label': 'Профиль снимка',
+                    'field': 'capture_profile',
+                    'required': True,
+                },
+                {
+                    'name': 'viewports',
+                    'label': 'Устройства',
+                    'field': 'viewports',
+                    'required': True,
+                },
                 {
                     'name': 'last_state',
                     'label': 'Последнее состояние',
                     'field': 'last_state',
                     'required': True,
                 },
+                {
+                    'name': 'changes',
+                    'label': 'Последнее изменение',
+                    'field': 'changes',
+                    'required': True,
+                },
             ],
             rows=[
                 {
                     'id': tr.id,
                     'url': str(tr.url),
                     'interval': str(tr.interval),
+                    'capture_profile': tr.capture_profile,
+                    'viewports': ', '.join(tr.viewports),
                     'last_state': (
                         '/screenshots/'
                         + tr.last_state.image_filename.split(
@@ -184,6 +304,14 @@ def index():
                         if tr.last_state
                         else 'none'
                     ),
+                    'changes': (
+                        '/screenshots/'
+                        + tr.last_state.overlay_filename.split(
+                            config.screenshots_folder
+                        )[1]
+                        if tr.last_state and tr.last_state.overlay_filename
+                        else ''
+                    ),
                 }
                 for tr in trackings
             ],
@@ -210,7 +338,11 @@ def index():
                     icon="remove" />
             </q-td>
             <q-td v-for="col in props.cols" :key="col.name" :props="props">
-                <a v-if="col.field == 'last_state' || col.field == 'url'" :href="col.value">{{ col.value }}</a>
+                <a v-if="col.field == 'changes' && col.value" :href="col.value">
+                    <img :src="col.value" style="max-width: 160px; max-height: 120px" />
+                </a>
+                <p v-else-if="col.field == 'changes'"></p>
+                <a v-else-if="col.field == 'last_state' || col.field == 'url'" :href="col.value">{{ col.value }}</a>
                 <p v-else>{{ col.value }}</p>
             </q-td>
         </q-tr>
@@ -234,13 +366,61 @@ def index():
         )
         table.on('deleteTracking', delete_tracking)
 
+    async def import_trackings(event: events.UploadEventArguments):
+        content = event.content.read().decode('utf-8-sig')
+        # parsing and scheduling thousands of trackings would stall every client
+        trackings, errors = await asyncio.to_thread(
+            parse_trackings,
+            content,
+            'json' if event.name.lower().endswith('.json') else 'csv',
+        )
+        created = await create_new_trackings(trackings)
+        if scheduler:
+            await asyncio.to_thread(scheduler.add_trackings, created)
+        trackings_list_ui.refresh()
+        ui.notification(
+            f'Импортировано отслеживаний: {len(created)}',
+            color='positive' if created else 'negative',
+        )
+        if errors:
+            ui.notification(
+                f'Пропущено записей с ошибками: {len(errors)}. '
+                + '; '.join(errors[:5]),
+                color='negative',
+                multi_line=True,
+            )
+
+    @ui.refreshable
+    def capture_stats_ui():
+        stats = admission.stats()
+        ui.label(
+            f'Снимков в работе: {stats.in_flight} из {admission.max_in_flight}, '
+            f'отложено: {stats.deferrals}, '
+            f'память браузеров: {stats.capture_rss_mb:.0f} МБ, '
+            f'ожидаемый пик снимка: {stats.estimate_mb:.0f} МБ, '
+            f'свободно: {stats.available_mb:.0f} МБ'
+        )
+
     app.add_static_files('/screenshots', config.screenshots_folder)
     ui.page_title('Главная | Is Site Works')
     ui.markdown('## Добавить новый сайт в отслеживание')
     create_new_tracking_ui()
+    ui.markdown('## Импорт и экспорт')
+    ui.upload(
+        label='Импорт отслеживаний из CSV или JSON',
+        auto_upload=True,
+        on_upload=import_trackings,
+    ).props('accept=".csv,.json"')
+    with ui.row():
+        ui.link('Экспорт отслеживаний', '/export/trackings.csv')
+        ui.link('Экспорт состояний', '/export/states.csv')
+        ui.link('Профилирование проверок', '/profiles')
     ui.markdown('## Все отслеживания')
-    trackings_list_ui()
+    await trackings_list_ui()
     ui.timer(3.0, lambda: trackings_list_ui.refresh())
+    if scheduler:
+        capture_stats_ui()
+        ui.timer(3.0, lambda: capture_stats_ui.refresh())
     ui.colors(
         primary=config.primary_color,
         positive=config.positive_color,
@@ -248,6 +428,20 @@ def index():
     )
 
 
+def number_or_default(value: float | None, default: float) -> float:
+    """
+    Returns the value of a number field, or the current setting if the field was cleared.
+
+    Args:
+        value (float | None): The value of the field, None if it is empty.
+        default (float): The value of the setting in use.
+
+    Returns:
+        float: The value to save.
+    """
+    return default if value is None else value
+
+
 @ui.page('/settings')
 def settings():
     """Define the settings page of the application.
@@ -258,6 +452,8 @@ def settings():
     each setting and a save button to persist changes.
     """
     async def save():
+        from notifications.tgbot import check_id, get_link
+
         if tg_user_tg_id_input.value != config.tg_user_tg_id:
             try:
                 await check_id(
@@ -270,6 +466,7 @@ def settings():
                     color='negative',
                 )
         data = {
+            **config.data,
             'tg': {
                 'user_tg_id': tg_user_tg_id_input.value,
                 'tg_bot_token': tg_bot_token_input.value,
@@ -280,6 +477,7 @@ def settings():
                 'negative_color': negative_color_input.value,
             },
             'mysql': {
+                **config.data['mysql'],
                 'name': mysql_name_input.value,
                 'username': mysql_username_input.value,
                 'password': mysql_password_input.value,
@@ -289,6 +487,42 @@ def settings():
             'screenshots': {
                 'folder': screenshots_folder_input.value,
             },
+            'capture': {
+                **config.data.get('capture', {}),
+                'page_load_timeout': number_or_default(
+                    page_load_timeout_input.value, config.capture_page_load_timeout
+                ),
+                'script_timeout': number_or_default(
+                    script_timeout_input.value, config.capture_script_timeout
+                ),
+                'check_timeout': number_or_default(
+                    check_timeout_input.value, config.capture_check_timeout
+                ),
+                'breaker_failures': int(
+                    number_or_default(
+                        breaker_failures_input.value, config.capture_breaker_failures
+                    )
+                ),
+                'breaker_cooldown': number_or_default(
+                    breaker_cooldown_input.value, config.capture_breaker_cooldown
+                ),
+                'cache_freshness': number_or_default(
+                    cache_freshness_input.value, config.capture_cache_freshness
+                ),
+                'per_host_limit': int(
+                    number_or_default(
+                        per_host_limit_input.value, config.capture_per_host_limit
+                    )
+                ),
+                'max_height': int(
+                    number_or_default(max_height_input.value, config.capture_max_height)
+                ),
+                'tile_threshold': int(
+                    number_or_default(
+                        tile_threshold_input.value, config.capture_tile_threshold
+                    )
+                ),
+            },
         }
         with open('./settings.json', mode='w') as file:
             json.dump(data, file)
@@ -364,6 +598,56 @@ def settings():
         placeholder='C:/screenshots',
         value=config.screenshots_folder,
     ).style('width: 100%;')
+    ui.markdown('#### Проверки')
+    with ui.row():
+        page_load_timeout_input = ui.number(
+            'Таймаут загрузки страницы, с',
+            placeholder='30',
+            value=config.capture_page_load_timeout,
+        )
+        script_timeout_input = ui.number(
+            'Таймаут скриптов, с',
+            placeholder='10',
+            value=config.capture_script_timeout,
+        )
+        check_timeout_input = ui.number(
+            'Таймаут всей проверки, с',
+            placeholder='90',
+            value=config.capture_check_timeout,
+        )
+    with ui.row():
+        breaker_failures_input = ui.number(
+            'Ошибок подряд до паузы сайта',
+            placeholder='3',
+            value=config.capture_breaker_failures,
+        )
+        breaker_cooldown_input = ui.number(
+            'Длительность паузы сайта, с',
+            placeholder='600',
+            value=config.capture_breaker_cooldown,
+        )
+    with ui.row():
+        cache_freshness_input = ui.number(
+            'Повторно использовать снимок сайта в течение, с',
+            placeholder='60',
+            value=config.capture_cache_freshness,
+        )
+        per_host_limit_input = ui.number(
+            'Одновременных снимков одного сайта',
+            placeholder='2',
+            value=config.capture_per_host_limit,
+        )
+    with ui.row():
+        max_height_input = ui.number(
+            'Максимальная высота снимка, px',
+            placeholder='20000',
+            value=config.capture_max_height,
+        )
+        tile_threshold_input = ui.number(
+            'Снимать по частям страницы выше, px',
+            placeholder='4000',
+            value=config.capture_tile_threshold,
+        )
     ui.button('Сохранить', on_click=save)
     ui.colors(
         primary=config.primary_color,
@@ -372,6 +656,75 @@ def settings():
     )
 
 
+@ui.page('/profiles')
+async def profiles():
+    """Define the profiling page of the application.
+
+    This page switches profiling on for the next checks of one tracking or of all trackings
+    and lists the written profiles for download. If the checks run in the daemon, the switch
+    is passed to it through the profiles folder and applied on its next sync.
+    """
+    trackings = await get_all_trackings_async()
+
+    def enable():
+        runs = int(runs_input.value or 0)
+        if runs <= 0:
+            ui.notification('Количество проверок должно быть > 0', color='negative')
+            return
+        if scheduler:
+            profiler.enable(runs, tracking_input.value)
+        else:
+            profiler.request(runs, tracking_input.value)
+        ui.notification('Профилирование включено', color='positive')
+
+    def disable():
+        if scheduler:
+            profiler.disable()
+        else:
+            profiler.request(0)
+        ui.notification('Профилирование отключено', color='positive')
+
+    @ui.refreshable
+    def profile_files_ui():
+        files = profiler.list_files()
+        if not files:
+            ui.label('Профилей пока нет')
+        for file in files:
+            with ui.row():
+                ui.link(file.name, f'/profiles/files/{file.name}')
+                ui.label(
+                    f'{file.size / 1024:.0f} КБ, {file.created_at:%d.%m.%Y %H:%M:%S}'
+                )
+
+    ui.page_title('Профилирование | Is Site Works')
+    ui.markdown('## Профилирование проверок')
+    ui.markdown(
+        'Следующие проверки выполняются под cProfile и tracemalloc. Для каждой сохраняется '
+        'файл `.prof` для pstats или snakeviz и отчёт `.txt` с самыми долгими функциями '
+        'и местами выделения памяти.'
+    )
+    with ui.row():
+        tracking_input = ui.select(
+            {None: 'Все отслеживания', **{tr.id: tr.url for tr in trackings}},
+            label='Отслеживание',
+            value=None,
+        ).style('min-width: 300px')
+        runs_input = ui.number('Количество проверок', value=5, min=1)
+    with ui.row():
+        ui.button('Включить', on_click=enable)
+        ui.button('Отключить', on_click=disable)
+    ui.markdown('#### Сохранённые профили')
+    profile_files_ui()
+    ui.timer(5.0, lambda: profile_files_ui.refresh())
+    ui.colors(
+        primary=config.primary_color,
+        positive=config.positive_color,
+        negative=config.negative_color,
+    )
+
+
+app.on_startup(lambda: print(record_startup('ui')))
+
 try:
     ui.run(reload=False)
 except KeyboardInterrupt:
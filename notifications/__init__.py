@@ -1 +1 @@
-from .tgbot import send_message
+from .tgbot import send_message, send_photos
@@ -1,3 +1,5 @@
+import pathlib
+
 import telegram
 
 import config
@@ -36,6 +38,36 @@ async def send_message(msg: str, photo: str | None = None):
             raise ValueError('User not found')
 
 
+async def send_photos(msg: str, photos: list[str]):
+    """
+    Send an album of photos with a caption to a predefined Telegram user.
+
+    The caption is attached to the first photo, so the album arrives as a single message.
+
+    Args:
+        msg: The caption of the album.
+        photos: The file paths of the photos, from 2 to 10.
+
+    Raises:
+        ValueError: If the message could not be delivered to the user.
+    """
+    bot = telegram.Bot(config.tg_bot_token)
+    async with bot:
+        try:
+            await bot.send_media_group(
+                chat_id=config.tg_user_tg_id,
+                media=[
+                    # given a path, the library reads the file and closes it itself
+                    telegram.InputMediaPhoto(
+                        media=pathlib.Path(photo), caption=msg if i == 0 else None
+                    )
+                    for i, photo in enumerate(photos)
+                ],
+            )
+        except telegram.error.Forbidden:
+            raise ValueError('User not found')
+
+
 async def check_id(tg_id: int, msg: str):
     """
     Send a message to a specified Telegram user to check if the user ID is valid.
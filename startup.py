@@ -0,0 +1,48 @@
+"""
+Startup time and baseline memory of the application's processes.
+
+Every entry point calls `record_startup` once it is ready to work. The measurement is
+appended to the CSV file set by `startup.log_file` in the settings, so that regressions,
+e.g. a heavy dependency imported eagerly again, show up when the history is compared.
+"""
+import csv
+import datetime as dt
+import os
+import time
+
+import psutil
+
+import config
+
+STARTUP_LOG_FIELDS = ['started_at', 'component', 'seconds', 'rss_mb']
+
+
+def record_startup(component: str) -> str:
+    """
+    Measures the time since the process was started and its resident memory, and logs them.
+
+    Args:
+        component (str): Name of the entry point, e.g. `ui` or `daemon`.
+
+    Returns:
+        str: A human-readable summary of the measurement.
+    """
+    process = psutil.Process()
+    started_at = dt.datetime.fromtimestamp(process.create_time())
+    seconds = time.time() - process.create_time()
+    rss_mb = process.memory_info().rss / 2**20
+    if config.startup_log_file:
+        is_new = not os.path.exists(config.startup_log_file)
+        with open(config.startup_log_file, 'a', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=STARTUP_LOG_FIELDS)
+            if is_new:
+                writer.writeheader()
+            writer.writerow(
+                {
+                    'started_at': started_at.isoformat(timespec='seconds'),
+                    'component': component,
+                    'seconds': f'{seconds:.2f}',
+                    'rss_mb': f'{rss_mb:.1f}',
+                }
+            )
+    return f'{component} started in {seconds:.2f} s, RSS {rss_mb:.1f} MB'